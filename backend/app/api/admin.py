@@ -0,0 +1,62 @@
+import os
+import logging
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, Field
+
+from app.core import profiling
+
+logger = logging.getLogger(__name__)
+
+# 管理接口令牌，未设置时管理接口整体关闭
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """校验 X-Admin-Token 请求头"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin API disabled")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+class ProfilingSettings(BaseModel):
+    enabled: Optional[bool] = None
+    sample_rate: Optional[float] = Field(None, ge=0.0, le=1.0)
+    torch: Optional[bool] = None
+
+
+@router.get("/profiling")
+def get_profiling():
+    """当前剖析设置"""
+    return profiling.settings
+
+
+@router.post("/profiling")
+def update_profiling(update: ProfilingSettings):
+    """开启/关闭回合剖析，调整抽样比例与 torch profiler 开关"""
+    for key, value in update.model_dump(exclude_none=True).items():
+        profiling.settings[key] = value
+    logger.info("Profiling settings updated", extra={"settings": dict(profiling.settings)})
+    return profiling.settings
+
+
+@router.get("/profiles")
+def list_profiles(client_id: Optional[str] = None):
+    """列出剖析文件，可按会话 client_id 过滤"""
+    return profiling.list_profiles(client_id)
+
+
+@router.get("/profiles/{name}")
+def download_profile(name: str):
+    """下载剖析文件（.folded 为火焰图折叠栈，.trace.json 为 torch trace）"""
+    path = profiling.resolve_profile(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=name)
@@ -0,0 +1,86 @@
+import os
+import logging
+import asyncio
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 文字增量合并窗口（毫秒）与单帧最大字节数，窗口为0时不合并
+TEXT_COALESCE_MS = float(os.getenv("TEXT_COALESCE_MS", "40"))
+TEXT_COALESCE_MAX_BYTES = int(os.getenv("TEXT_COALESCE_MAX_BYTES", "256"))
+
+# 遇到句末标点立即下发，保证文字不落后于对应的语音
+SENTENCE_BOUNDARIES = {".", "。", "?", "？", "!", "！", ";", "；", "\n"}
+
+
+class TextCoalescer:
+    """
+    把 LLM 逐 token 的文字增量合并成按时间窗口下发的 text-update 帧：
+    1. 窗口内的增量拼接为一帧
+    2. 累积超过 max_bytes 或遇到句末标点时立即下发
+    3. flush() 强制下发（例如开始合成语音之前、回合结束时）
+    """
+
+    def __init__(
+        self,
+        send: Callable[[dict], Awaitable[None]],
+        window_ms: float = TEXT_COALESCE_MS,
+        max_bytes: int = TEXT_COALESCE_MAX_BYTES,
+    ):
+        self._send = send
+        self.window = window_ms / 1000.0
+        self.max_bytes = max_bytes
+        self._pending: List[str] = []
+        self._pending_bytes = 0
+        self._timer: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        # 统计：收到的增量数与实际下发的帧数
+        self.deltas = 0
+        self.frames = 0
+
+    async def add(self, text: str):
+        """追加一段文字增量"""
+        if not text:
+            return
+        self._pending.append(text)
+        self._pending_bytes += len(text.encode("utf-8"))
+        self.deltas += 1
+
+        if (
+            self.window <= 0
+            or self._pending_bytes >= self.max_bytes
+            or any(c in SENTENCE_BOUNDARIES for c in text)
+        ):
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.window)
+        except asyncio.CancelledError:
+            return
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception as e:
+            # 定时下发失败（如连接已断开）由主流程的下一次发送感知
+            logger.warning("Text coalescer flush failed: %s", e)
+
+    async def flush(self):
+        """立即下发所有待发送文字"""
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            if not self._pending:
+                return
+            content = "".join(self._pending)
+            self._pending = []
+            self._pending_bytes = 0
+            self.frames += 1
+            await self._send({"type": "text-update", "content": content})
+
+    async def close(self):
+        """下发剩余文字并停止定时器"""
+        await self.flush()
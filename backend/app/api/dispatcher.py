@@ -0,0 +1,73 @@
+import os
+import logging
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+
+from app.core.tts import TTS_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# 每个回合最多同时合成的句子数，为1时逐句合成（LLM 文字流不受影响）；
+# 默认为 TTS_CONCURRENCY 的一半，多副本时单个回合不会占满 TTS 并发，最多不超过 TTS_CONCURRENCY
+TTS_LOOKAHEAD = max(1, min(int(os.getenv("TTS_LOOKAHEAD", str(TTS_CONCURRENCY // 2))), TTS_CONCURRENCY))
+
+
+class SentenceDispatcher:
+    """
+    回合内的句子合成调度：
+    1. submit() 只登记句子、不等待合成或下发，LLM 文字流不会因 TTS 而停顿
+    2. 同时合成的句子数不超过 lookahead，多句可在不同 TTS 副本上并行，按提交顺序开始合成
+    3. 合成结果严格按提交顺序交给 deliver()，后面的句子先合成完也要等前面的下发
+    """
+
+    def __init__(
+        self,
+        synthesize: Callable[[str], Awaitable[Any]],
+        deliver: Callable[[Any], Awaitable[None]],
+        lookahead: int = TTS_LOOKAHEAD,
+    ):
+        self._synthesize = synthesize
+        self._deliver = deliver
+        self._slots = asyncio.Semaphore(max(1, lookahead))
+        self._pending: "asyncio.Queue[Optional[asyncio.Task]]" = asyncio.Queue()
+        self._deliverer = asyncio.create_task(self._deliver_in_order())
+        self.submitted = 0
+        # 统计：下发时已经合成完毕、无需等待的句子数
+        self.ready_on_delivery = 0
+
+    async def submit(self, text: str):
+        """提交一句待合成文本，不等待合成槽位"""
+        if self._deliverer.done():
+            # 下发任务已异常退出（如连接断开），抛出其异常
+            self._deliverer.result()
+            raise RuntimeError("Sentence dispatcher is closed")
+        self.submitted += 1
+        self._pending.put_nowait(asyncio.create_task(self._run(text)))
+
+    async def _run(self, text: str):
+        async with self._slots:
+            return await self._synthesize(text)
+
+    async def _deliver_in_order(self):
+        while True:
+            task = await self._pending.get()
+            if task is None:
+                return
+            if task.done():
+                self.ready_on_delivery += 1
+            result = await task
+            if result:
+                await self._deliver(result)
+
+    async def close(self):
+        """等待所有已提交句子按顺序下发完毕"""
+        self._pending.put_nowait(None)
+        await self._deliverer
+
+    def cancel(self):
+        """放弃未下发的句子（回合出错或连接断开时）"""
+        self._deliverer.cancel()
+        while not self._pending.empty():
+            task = self._pending.get_nowait()
+            if task is not None:
+                task.cancel()
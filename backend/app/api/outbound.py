@@ -0,0 +1,184 @@
+import os
+import logging
+import time
+import asyncio
+from collections import deque
+from typing import Any, Deque, Optional, Tuple, Union
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# 每个连接的待发送消息上限
+OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", "64"))
+# 平均发送延迟超过该值（毫秒）视为慢速客户端
+SLOW_CONSUMER_LAG_MS = float(os.getenv("SLOW_CONSUMER_LAG_MS", "1000"))
+# 队列持续满载或单次发送卡住超过该时长（秒）则断开连接
+SLOW_CONSUMER_DEADLINE_S = float(os.getenv("SLOW_CONSUMER_DEADLINE_S", "15"))
+# 慢速客户端的语音输出降采样到该采样率，0 表示不降级
+SLOW_CONSUMER_SAMPLE_RATE = int(os.getenv("SLOW_CONSUMER_SAMPLE_RATE", "16000"))
+
+# 发送延迟的指数滑动平均系数
+_LAG_EWMA_ALPHA = 0.2
+
+
+class OutboundClosed(Exception):
+    """发送队列已关闭（连接断开或被判定为慢速客户端）"""
+
+
+class SlowConsumerError(OutboundClosed):
+    """客户端接收过慢，超过 SLOW_CONSUMER_DEADLINE_S 仍无法发送"""
+
+
+class OutboundQueue:
+    """
+    每个连接独立的有界发送队列，由后台任务负责真正写入 socket：
+    1. 生产者（LLM/TTS 流程）只入队，不等待网络
+    2. 尚未发出的 text-update 与新增量合并，队列积压时不会堆积大量小帧
+    3. 队列满时生产者最多等待 deadline，超时判定为慢速客户端并断开，
+       避免卡住的连接占用推理资源或在内存中囤积语音
+    4. 统计每条消息从入队到发出的延迟
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        client_id: str,
+        maxsize: int = OUTBOUND_QUEUE_SIZE,
+        slow_lag_ms: float = SLOW_CONSUMER_LAG_MS,
+        deadline: float = SLOW_CONSUMER_DEADLINE_S,
+    ):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.maxsize = max(1, maxsize)
+        self.slow_lag = slow_lag_ms / 1000.0
+        self.deadline = deadline
+        self._queue: Deque[Tuple[float, Any]] = deque()
+        self._not_empty = asyncio.Event()
+        self._changed = asyncio.Event()
+        self._error: Optional[OutboundClosed] = None
+        # 统计
+        self.sent = 0
+        self.merged = 0
+        self.lag_ewma = 0.0
+        self.lag_max = 0.0
+        self._lag_total = 0.0
+        self._task = asyncio.create_task(self._sender())
+
+    @property
+    def is_slow(self) -> bool:
+        """当前连接是否处于慢速状态"""
+        return self.lag_ewma > self.slow_lag
+
+    @property
+    def closed(self) -> bool:
+        return self._error is not None
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "merged": self.merged,
+            "pending": len(self._queue),
+            "lag_avg_ms": round(self._lag_total / self.sent * 1000, 1) if self.sent else 0.0,
+            "lag_ewma_ms": round(self.lag_ewma * 1000, 1),
+            "lag_max_ms": round(self.lag_max * 1000, 1),
+            "slow": self.is_slow,
+        }
+
+    async def send(self, message: Union[dict, bytes, bytearray]):
+        """
+        消息入队（dict 以 JSON 文本帧发送，bytes 以二进制帧原样发送）；
+        队列满时最多等待 deadline，连接已关闭时抛出 OutboundClosed
+        """
+        if self._error is not None:
+            raise self._error
+
+        # 合并尚未发出的文字增量（前端按顺序拼接，合并不丢内容）
+        if isinstance(message, dict) and message.get("type") == "text-update" and self._queue:
+            _, tail = self._queue[-1]
+            if isinstance(tail, dict) and tail.get("type") == "text-update":
+                tail["content"] += message["content"]
+                self.merged += 1
+                return
+
+        if len(self._queue) >= self.maxsize:
+            give_up_at = time.monotonic() + self.deadline
+            while len(self._queue) >= self.maxsize and self._error is None:
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    await self._abort(SlowConsumerError(
+                        f"outbound queue full for {self.deadline:.0f}s"
+                    ))
+                    break
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            if self._error is not None:
+                raise self._error
+
+        self._queue.append((time.monotonic(), message))
+        self._not_empty.set()
+
+    async def _sender(self):
+        try:
+            while True:
+                if not self._queue:
+                    self._not_empty.clear()
+                    await self._not_empty.wait()
+                    continue
+                enqueued_at, message = self._queue.popleft()
+                self._changed.set()
+                try:
+                    if isinstance(message, (bytes, bytearray)):
+                        frame = self.websocket.send_bytes(message)
+                    else:
+                        frame = self.websocket.send_json(message)
+                    await asyncio.wait_for(frame, self.deadline)
+                except asyncio.TimeoutError:
+                    await self._abort(SlowConsumerError(
+                        f"send stalled for {self.deadline:.0f}s"
+                    ))
+                    return
+                except Exception as e:
+                    self._fail(OutboundClosed(str(e)))
+                    return
+                self._record_lag(time.monotonic() - enqueued_at)
+        except asyncio.CancelledError:
+            pass
+
+    def _record_lag(self, lag: float):
+        self.sent += 1
+        self._lag_total += lag
+        self.lag_max = max(self.lag_max, lag)
+        was_slow = self.is_slow
+        self.lag_ewma = lag if self.sent == 1 else (
+            _LAG_EWMA_ALPHA * lag + (1 - _LAG_EWMA_ALPHA) * self.lag_ewma
+        )
+        if self.is_slow and not was_slow:
+            logger.warning("Slow consumer detected", extra={"lag_ewma_ms": round(self.lag_ewma * 1000)})
+
+    def _fail(self, error: OutboundClosed):
+        if self._error is None:
+            self._error = error
+        self._queue.clear()
+        self._changed.set()
+
+    async def _abort(self, error: SlowConsumerError):
+        """判定为慢速客户端：丢弃待发消息并关闭连接"""
+        logger.warning("Disconnecting slow consumer: %s", error)
+        self._fail(error)
+        try:
+            await self.websocket.close(code=1008, reason="slow consumer")
+        except Exception:
+            pass
+
+    async def close(self):
+        """停止后台发送任务"""
+        self._fail(OutboundClosed("outbound queue closed"))
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,18 @@
+from fastapi import APIRouter
+
+from app.core import admission, llm, tts
+from app.core.audio_buffer import get_usage
+
+router = APIRouter(prefix="/status")
+
+
+@router.get("/capacity")
+def capacity():
+    """当前负载与容量：各推理阶段的并发、排队与耗时，预估首段语音延迟及是否接受新连接"""
+    return {
+        **admission.snapshot(),
+        "audio_buffers": get_usage(),
+        "tts_models": tts.registry.snapshot(),
+        "llm_endpoints": llm.endpoint_stats(),
+        "caches": {"llm": llm.response_cache.stats(), "tts": tts.wav_cache.stats()},
+    }
@@ -0,0 +1,196 @@
+import os
+import math
+import logging
+import json
+import time
+import uuid
+import asyncio
+from collections import deque
+from typing import Optional
+
+import av
+import numpy as np
+import soundfile as sf
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from faster_whisper.audio import decode_audio
+
+from app.core.asr import ASR_NUM_WORKERS, SAMPLE_RATE, asr_stage, split_on_vad, transcribe_chunk
+from app.core.audio import convert_audio_to_wav
+from app.core import admission
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# 上传文件大小上限
+ASR_MAX_UPLOAD_MB = float(os.getenv("ASR_MAX_UPLOAD_MB", "500"))
+# 音频时长上限（秒）：解码后为 16kHz float32，每小时约 230MB 内存
+ASR_MAX_DURATION_S = float(os.getenv("ASR_MAX_DURATION_S", "7200"))
+# 切块边界两侧补充的静音（秒），避免截断首尾音节
+CHUNK_PADDING_S = 0.2
+# 上传文件分块写盘的块大小
+_UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class AudioTooLong(Exception):
+    """音频时长超过 ASR_MAX_DURATION_S"""
+
+
+def _check_duration(duration: Optional[float]):
+    if duration is not None and duration > ASR_MAX_DURATION_S:
+        raise AudioTooLong(f"Audio is {duration:.0f}s, exceeds {ASR_MAX_DURATION_S:.0f}s limit")
+
+
+def _probe_duration(path: str) -> Optional[float]:
+    """读取容器声明的时长（秒），不解码；无法获取时返回 None"""
+    try:
+        with av.open(path) as container:
+            if container.duration is not None:
+                return container.duration / av.time_base
+            stream = container.streams.audio[0]
+            if stream.duration is not None and stream.time_base is not None:
+                return float(stream.duration * stream.time_base)
+    except Exception:
+        pass
+    return None
+
+
+async def _load_audio(path: str) -> np.ndarray:
+    """
+    解码为 16kHz 单声道 float32；PyAV 解码失败时回退到 convert_audio_to_wav。
+    解码前按容器时长检查 ASR_MAX_DURATION_S，避免小体积的压缩音频解码出数 GB 的采样
+    """
+    _check_duration(await asyncio.to_thread(_probe_duration, path))
+    try:
+        audio = await asyncio.to_thread(decode_audio, path, SAMPLE_RATE)
+    except Exception as e:
+        logger.warning("Direct decode failed (%s), falling back to conversion chain", e)
+    else:
+        # 容器未声明时长时以解码结果为准
+        _check_duration(len(audio) / SAMPLE_RATE)
+        return audio
+    wav_path = await convert_audio_to_wav(path, path + ".wav")
+    if wav_path is None:
+        raise ValueError("Unsupported or corrupted audio file")
+    try:
+        try:
+            info = sf.info(wav_path)
+        except Exception as e:
+            raise ValueError(f"Unsupported or corrupted audio file: {e}") from e
+        _check_duration(info.duration)
+        audio, _ = sf.read(wav_path, dtype="float32")
+    except Exception as e:
+        raise ValueError(f"Unsupported or corrupted audio file: {e}") from e
+    finally:
+        if wav_path != path and os.path.exists(wav_path):
+            os.remove(wav_path)
+    return audio.mean(axis=1) if audio.ndim > 1 else audio
+
+
+@router.post("/asr/transcribe")
+async def asr_transcribe(file: UploadFile = File(...), language: Optional[str] = Form("zh")):
+    """
+    长音频识别：按 VAD 边界切块，块之间并行识别（并行度 ASR_NUM_WORKERS），
+    以 NDJSON 按时间顺序流式返回带时间戳的分段 {"type": "segment", "start", "end", "text"}，
+    最后一行为统计 {"type": "summary", ...}。
+    """
+    # 实时对话优先：推理容量不足时拒绝离线请求
+    rejection = admission.check_capacity(sessions=False)
+    if rejection is not None:
+        raise HTTPException(status_code=503, detail=rejection.reason,
+                            headers={"Retry-After": str(math.ceil(rejection.retry_after))})
+    max_bytes = int(ASR_MAX_UPLOAD_MB * 1024 * 1024)
+    too_large = HTTPException(status_code=413, detail=f"Upload exceeds {ASR_MAX_UPLOAD_MB:.0f}MB limit")
+    # multipart 解析时 Starlette 已把请求体缓存到临时文件，这里只能省去再复制一次
+    if file.size is not None and file.size > max_bytes:
+        raise too_large
+    request_id = str(uuid.uuid4())
+    suffix = os.path.splitext(file.filename or "")[1] or ".bin"
+    temp_path = f"temp_upload_{request_id}{suffix}"
+
+    try:
+        # 分块写盘，超过上限立即中止
+        written = 0
+        with open(temp_path, "wb") as f:
+            while True:
+                chunk = await file.read(_UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise too_large
+                await asyncio.to_thread(f.write, chunk)
+        audio = await _load_audio(temp_path)
+    except AudioTooLong as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    start = time.perf_counter()
+    chunks = await asyncio.to_thread(split_on_vad, audio)
+    duration = len(audio) / SAMPLE_RATE
+    logger.info("ASR transcribe request", extra={"request_id": request_id[:8], "duration_s": round(duration, 1), "chunks": len(chunks)})
+
+    padding = int(CHUNK_PADDING_S * SAMPLE_RATE)
+    async def run_chunk(chunk_start: int, chunk_end: int):
+        begin = max(0, chunk_start - padding)
+        # 与语音回合共用 ASR 并发阶段，但以离线优先级排队：有语音回合等待时让行
+        async with asr_stage.slot(offline=True):
+            return await asyncio.to_thread(
+                transcribe_chunk,
+                audio[begin:min(len(audio), chunk_end + padding)],
+                begin / SAMPLE_RATE,
+                language or None,
+            )
+
+    async def generate():
+        # 滑动窗口：最多 ASR_NUM_WORKERS 个块同时在途，按块顺序依次输出
+        tasks = deque()
+        pending = iter(chunks)
+
+        def fill():
+            while len(tasks) < ASR_NUM_WORKERS:
+                chunk = next(pending, None)
+                if chunk is None:
+                    return
+                tasks.append(asyncio.create_task(run_chunk(*chunk)))
+
+        segments = 0
+        try:
+            fill()
+            index = -1
+            while tasks:
+                index += 1
+                task = tasks.popleft()
+                try:
+                    results = await task
+                except Exception as e:
+                    fill()
+                    logger.error("ASR chunk %d failed: %s", index, e)
+                    yield json.dumps({"type": "error", "chunk": index, "content": str(e)}) + "\n"
+                    continue
+                fill()
+                for segment in results:
+                    segments += 1
+                    yield json.dumps({"type": "segment", "chunk": index, **segment}, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端中途断开时取消未开始的块
+            for task in tasks:
+                task.cancel()
+
+        elapsed = time.perf_counter() - start
+        yield json.dumps({
+            "type": "summary",
+            "duration_s": round(duration, 2),
+            "chunks": len(chunks),
+            "segments": segments,
+            "workers": ASR_NUM_WORKERS,
+            "elapsed_s": round(elapsed, 3),
+            "rtf": round(elapsed / duration, 3) if duration else None,
+        }) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
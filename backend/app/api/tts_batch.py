@@ -0,0 +1,132 @@
+import os
+import math
+import logging
+import json
+import base64
+import time
+import asyncio
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from app.core.audio import validate_output_sample_rate
+from app.core.tts import TTS_CONCURRENCY, list_voices, resolve_voice, text_to_wav
+from app.core import admission
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# 单次批量请求的条数上限、单条文本的字数上限与并发合成数
+TTS_BATCH_MAX_ITEMS = int(os.getenv("TTS_BATCH_MAX_ITEMS", "200"))
+TTS_BATCH_MAX_CHARS = int(os.getenv("TTS_BATCH_MAX_CHARS", "500"))
+# 并发合成数默认等于 TTS_CONCURRENCY，再高也只是在 TTS 阶段排队
+TTS_BATCH_CONCURRENCY = max(1, int(os.getenv("TTS_BATCH_CONCURRENCY", str(TTS_CONCURRENCY))))
+
+
+class TTSBatchRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1)
+    sample_rate: Optional[int] = None
+    concurrency: Optional[int] = None
+    voice: Optional[str] = None
+
+
+@router.get("/tts/voices")
+def voices():
+    """可选的音色列表（会话 config 消息的 voice 字段、/tts/batch 的 voice 参数）"""
+    return list_voices()
+
+
+@router.post("/tts/batch")
+async def tts_batch(request: TTSBatchRequest):
+    """
+    批量离线合成：一次提交多条文本，按完成顺序以 NDJSON 流式返回。
+    每行一个结果 {"type": "result", "index", "text", "audio"}，
+    最后一行为吞吐统计 {"type": "summary", ...}。
+    相同文本只合成一次，结果分发给所有对应条目。
+    """
+    if len(request.texts) > TTS_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {TTS_BATCH_MAX_ITEMS} texts per batch")
+    too_long = [index for index, text in enumerate(request.texts) if len(text) > TTS_BATCH_MAX_CHARS]
+    if too_long:
+        raise HTTPException(status_code=413, detail=f"Texts longer than {TTS_BATCH_MAX_CHARS} characters: {too_long[:10]}")
+    if request.sample_rate is not None:
+        try:
+            validate_output_sample_rate(request.sample_rate)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    try:
+        voice = resolve_voice(request.voice)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    # 实时对话优先：推理容量不足时拒绝离线请求
+    rejection = admission.check_capacity(sessions=False)
+    if rejection is not None:
+        raise HTTPException(status_code=503, detail=rejection.reason,
+                            headers={"Retry-After": str(math.ceil(rejection.retry_after))})
+    concurrency = max(1, min(request.concurrency or TTS_BATCH_CONCURRENCY, TTS_BATCH_CONCURRENCY))
+
+    # 去重：text -> 所有出现位置
+    positions = {}
+    for index, text in enumerate(request.texts):
+        positions.setdefault(text.strip(), []).append(index)
+
+    async def generate():
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def render(text: str):
+            async with semaphore:
+                item_start = time.perf_counter()
+                # 离线优先级：有实时回合在等待 TTS 时让行
+                wav_bytes, duration = await text_to_wav(text, request.sample_rate, voice, offline=True)
+                return text, wav_bytes, duration, time.perf_counter() - item_start
+
+        tasks = [asyncio.create_task(render(text)) for text in positions]
+        completed = failed = 0
+        audio_seconds = 0.0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                text, wav_bytes, duration, elapsed = await next_done
+                audio = base64.b64encode(wav_bytes).decode("utf-8") if wav_bytes else ""
+                # 重复文本只合成一次，音频时长也只计一次
+                audio_seconds += duration
+                for index in positions[text]:
+                    if audio:
+                        completed += 1
+                    else:
+                        failed += 1
+                    yield json.dumps({
+                        "type": "result",
+                        "index": index,
+                        "text": text,
+                        "audio": audio,
+                        "ok": bool(audio),
+                        "duration_s": round(duration, 3),
+                        "elapsed_ms": round(elapsed * 1000),
+                    }, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端中途断开时取消未完成的合成
+            for task in tasks:
+                task.cancel()
+
+        wall = time.perf_counter() - start
+        yield json.dumps({
+            "type": "summary",
+            "items": len(request.texts),
+            "unique": len(positions),
+            "completed": completed,
+            "failed": failed,
+            "concurrency": concurrency,
+            "elapsed_s": round(wall, 3),
+            "items_per_s": round(len(request.texts) / wall, 2) if wall else None,
+            "chars_per_s": round(sum(len(t) for t in positions) / wall, 1) if wall else None,
+            "audio_s": round(audio_seconds, 3),
+            # 每秒墙钟时间合成的音频秒数（>1 表示快于实时）
+            "audio_s_per_s": round(audio_seconds / wall, 2) if wall else None,
+        }) + "\n"
+
+    logger.info("TTS batch request", extra={"items": len(request.texts), "unique": len(positions), "concurrency": concurrency})
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
@@ -1,135 +1,38 @@
 import os
 import json
+import math
 import base64
 import asyncio
 import uuid
-import subprocess
+import logging
 import tempfile
 from pathlib import Path
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from app.core.asr import transcribe_audio
+from app.core.asr import transcribe_audio, asr_stage
 from app.core.llm import chat_stream
-from app.core.tts import text_to_speech
-import soundfile as sf
+from app.core.tts import DEFAULT_VOICE, effective_sample_rate, resolve_voice, text_to_speech, text_to_wav
+from app.core.audio_buffer import AudioIngestBuffer, AudioBufferOverflow
+from app.api.coalescer import TextCoalescer
+from app.api.dispatcher import SentenceDispatcher
+from app.api.outbound import OutboundQueue, OutboundClosed, SLOW_CONSUMER_SAMPLE_RATE
+from app.core.audio import (
+    OpusPacketDecoder,
+    convert_audio_to_wav,
+    validate_audio_transport,
+    pcm16_to_float32,
+    validate_input_format,
+    validate_output_sample_rate,
+)
+from app.core.profiling import profile_turn
+from app.core.log import bind_context
+from app.core import admission
+from app.core.capture import start_capture
+from app.core import filler
 import io
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
 
-async def convert_audio_to_wav(input_path: str, output_path: str = None) -> str:
-    """
-    将音频文件转换为 WAV 格式，支持多种方法
-    返回转换后的 WAV 文件路径，如果失败则返回原始文件路径
-    """
-    if output_path is None:
-        output_path = input_path.replace(".webm", ".wav").replace(".mp3", ".wav").replace(".ogg", ".wav")
-
-    # 方法1: 使用本地 ffmpeg 工具
-    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    local_ffmpeg = os.path.join(project_root, "tools", "ffmpeg", "ffmpeg.exe")
-    ffmpeg_cmd = local_ffmpeg if os.path.exists(local_ffmpeg) else "ffmpeg"
-
-    # 检查输入文件是否存在且大小合理
-    if not os.path.exists(input_path):
-        print(f"❌ Input file does not exist: {input_path}")
-    else:
-        file_size = os.path.getsize(input_path)
-        if file_size < 1024:  # 小于1KB的文件可能无效
-            print(f"⚠️ Input file too small ({file_size} bytes), may be invalid")
-
-    # 重试机制
-    max_retries = 2
-    for attempt in range(max_retries):
-        try:
-            # 尝试使用 ffmpeg 转换
-            subprocess.run(
-                [ffmpeg_cmd, "-y", "-i", input_path, "-ac", "1", "-ar", "16000", output_path],
-                check=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                timeout=30
-            )
-            print(f"✅ FFmpeg conversion successful (attempt {attempt+1}/{max_retries}): {input_path} -> {output_path}")
-            return output_path
-        except (subprocess.TimeoutExpired, subprocess.CalledProcessError, FileNotFoundError, OSError) as e:
-            print(f"⚠️ FFmpeg conversion failed (attempt {attempt+1}/{max_retries}): {e}")
-            if attempt == max_retries - 1:
-                print(f"❌ All ffmpeg attempts failed")
-            else:
-                # 等待片刻后重试
-                import time
-                time.sleep(0.5)
-
-    # 方法2: 尝试使用 pydub (如果可用)
-    try:
-        # 设置 pydub 使用的 ffmpeg 路径
-        import pydub
-        # 确保使用我们本地的 ffmpeg
-        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        local_ffmpeg_dir = os.path.join(project_root, "tools", "ffmpeg")
-        local_ffmpeg = os.path.join(local_ffmpeg_dir, "ffmpeg.exe")
-        local_ffprobe = os.path.join(local_ffmpeg_dir, "ffprobe.exe")
-
-        # 设置环境变量和 pydub 配置
-        os.environ["PATH"] = local_ffmpeg_dir + os.pathsep + os.environ.get("PATH", "")
-        pydub.AudioSegment.converter = local_ffmpeg
-        pydub.AudioSegment.ffprobe = local_ffprobe if os.path.exists(local_ffprobe) else None
-
-        from pydub import AudioSegment
-        # 尝试根据扩展名读取
-        ext = os.path.splitext(input_path)[1].lower()
-        if ext == ".webm":
-            audio = AudioSegment.from_file(input_path, format="webm")
-        elif ext == ".mp3":
-            audio = AudioSegment.from_file(input_path, format="mp3")
-        else:
-            # 尝试自动检测
-            audio = AudioSegment.from_file(input_path)
-
-        # 转换为单声道，16000Hz采样率
-        audio = audio.set_channels(1).set_frame_rate(16000)
-        audio.export(output_path, format="wav")
-        print(f"✅ Pydub conversion successful: {input_path} -> {output_path}")
-        return output_path
-    except Exception as e:
-        print(f"⚠️ Pydub conversion failed: {e}")
-        import traceback
-        traceback.print_exc()
-
-    # 方法3: 如果原始文件已经是.wav或无法转换，返回原始路径
-    # 检查文件是否有效
-    if input_path.lower().endswith('.wav'):
-        try:
-            # 验证WAV文件是否可以读取
-            data, samplerate = sf.read(input_path)
-            print(f"✅ Using original WAV file: {input_path}")
-            return input_path
-        except Exception as e:
-            print(f"❌ WAV file validation failed: {e}")
-
-    # 方法4: 尝试使用 torchaudio (如果可用)
-    try:
-        import torchaudio
-        # 使用 torchaudio 加载并保存为 WAV
-        waveform, sample_rate = torchaudio.load(input_path)
-        # 转换为单声道（如果需要）
-        if waveform.shape[0] > 1:
-            waveform = waveform.mean(dim=0, keepdim=True)
-        # 重采样到 16000 Hz（如果需要）
-        if sample_rate != 16000:
-            resampler = torchaudio.transforms.Resample(orig_freq=sample_rate, new_freq=16000)
-            waveform = resampler(waveform)
-        # 保存为 WAV
-        torchaudio.save(output_path, waveform, 16000)
-        print(f"✅ Torchaudio conversion successful: {input_path} -> {output_path}")
-        return output_path
-    except Exception as e:
-        print(f"⚠️ Torchaudio conversion failed: {e}")
-        import traceback
-        traceback.print_exc()
-
-    # 所有方法都失败
-    print(f"❌ All audio conversion methods failed for: {input_path}")
-    return None
+router = APIRouter()
 
 @router.websocket("/ws/chat")
 async def websocket_endpoint(websocket: WebSocket):
@@ -138,10 +41,58 @@ async def websocket_endpoint(websocket: WebSocket):
     """
     await websocket.accept()
     client_id = str(uuid.uuid4())[:8] # 给每个连接生成一个短ID方便日志查看
-    print(f"🔌 Client connected: {client_id}")
+    bind_context(client_id=client_id)
+    logger.info("Client connected")
+
+    # 准入控制：预估首段语音延迟超出目标时排队或拒绝（1013 Try Again Later）
+    async def notify_queued(retry_after: float):
+        await websocket.send_json({"type": "queued", "retry_after": math.ceil(retry_after)})
 
-    # 用于暂存接收到的音频切片
-    audio_buffer = bytearray()
+    try:
+        await admission.admit_session(notify_queued)
+    except admission.AdmissionRejected as e:
+        try:
+            await websocket.send_json({
+                "type": "busy",
+                "content": "Server is at capacity, please retry later",
+                "retry_after": math.ceil(e.retry_after),
+            })
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+        return
+    except WebSocketDisconnect:
+        logger.info("Client disconnected while queued")
+        return
+
+    # 可选的入站流量录制，用于 replay_capture.py 复现
+    capture = start_capture(client_id)
+
+    # 所有下行消息经由有界队列异步发送，慢速客户端不会拖住 LLM/TTS 流程
+    outbound = OutboundQueue(websocket, client_id)
+
+    # 会话参数，由客户端 config 消息协商
+    session_config = {
+        "sample_rate": None,  # 输出音频采样率，None 表示使用模型原生采样率
+        "input_format": "webm",  # 录音输入格式，见 app.core.audio.INPUT_FORMATS
+        "voice": DEFAULT_VOICE,  # 合成音色，见 GET /tts/voices
+        "audio_transport": "json",  # 下行语音传输方式：json（base64）或 binary（WAV 二进制帧）
+    }
+    # input_format 为 opus 时的会话级解码器
+    opus_decoder = None
+
+    def output_sample_rate():
+        """
+        本次合成实际使用的输出采样率：不超过模型原生采样率（不升采样），
+        慢速客户端自动降采样以减少带宽
+        """
+        rate = session_config["sample_rate"]
+        if outbound.is_slow and SLOW_CONSUMER_SAMPLE_RATE:
+            rate = min(rate, SLOW_CONSUMER_SAMPLE_RATE) if rate else SLOW_CONSUMER_SAMPLE_RATE
+        return effective_sample_rate(rate, session_config["voice"])
+
+    # 用于暂存接收到的音频切片（有上限，过大时落盘）
+    audio_buffer = AudioIngestBuffer()
 
     # 对话历史管理（维护上下文）
     message_history = [
@@ -157,211 +108,329 @@ async def websocket_endpoint(websocket: WebSocket):
             # 删除最旧的用户/助手消息（跳过system消息）
             if len(message_history) > 1:
                 removed = message_history.pop(1)  # 移除system之后的第一条消息
-                print(f"📝 [{client_id}] Removed old message from history: {removed['role']}")
+                logger.debug("Removed old message from history", extra={"role": removed["role"]})
+
+    # LLM 标点断句集合：遇到这些字符时把累积文本送去合成
+    punctuation = {",", "，", ".", "。", "?", "？", "!", "！", ";", "；", ":", "：", "\n"}
+
+    async def generate_reply():
+        """流式获取 LLM 回复：文字合并成帧推送，按句并行合成、按序下发语音，并写入对话历史"""
+        sentence_buffer = ""
+        full_response = ""  # 收集完整回复以便添加到历史
+        # 逐 token 的文字增量按时间窗口合并后再下发
+        coalescer = TextCoalescer(outbound.send)
+
+        async def synthesize(text: str):
+            if session_config["audio_transport"] == "binary":
+                # WAV 原样作为二进制帧下发，省去 base64 与 JSON 编码
+                wav_bytes, _ = await text_to_wav(text, output_sample_rate(), session_config["voice"])
+                return wav_bytes
+            return await text_to_speech(text, output_sample_rate(), session_config["voice"])
+
+        async def deliver(audio):
+            # 先把已生成的文字推给前端，保证文字不落后于语音
+            await coalescer.flush()
+            if isinstance(audio, (bytes, bytearray)):
+                await outbound.send(audio)
+                return
+            await outbound.send({
+                "type": "audio-chunk",
+                "content": audio
+            })
+
+        # 后续句子在前一句合成时即开始合成，语音严格按句序下发
+        dispatcher = SentenceDispatcher(synthesize, deliver)
+
+        try:
+            async for chunk in chat_stream(message_history):
+                # 实时推流文字
+                await coalescer.add(chunk)
+                full_response += chunk
+
+                # 断句：增量可能包含多个字符（多字 token、缓存回放），逐字检查标点
+                for char in chunk:
+                    sentence_buffer += char
+                    if char in punctuation and len(sentence_buffer.strip()) > 1:
+                        logger.debug("Synthesizing sentence", extra={"chars": len(sentence_buffer), "sample": True})
+                        await dispatcher.submit(sentence_buffer)
+                        sentence_buffer = ""
+
+            # 处理剩余文本
+            if sentence_buffer.strip():
+                logger.debug("Synthesizing final sentence", extra={"chars": len(sentence_buffer), "sample": True})
+                await dispatcher.submit(sentence_buffer)
+
+            await dispatcher.close()
+            await coalescer.close()
+
+            # 将助手回复添加到对话历史
+            if full_response.strip():
+                add_to_history("assistant", full_response.strip())
+                logger.info("Reply completed", extra={
+                    "chars": len(full_response),
+                    "text_frames": coalescer.frames,
+                    "text_deltas": coalescer.deltas,
+                    "sentences": dispatcher.submitted,
+                    "sentences_ready": dispatcher.ready_on_delivery,
+                })
+
+        except OutboundClosed:
+            raise
+        except Exception as e:
+            logger.exception("LLM/TTS process error")
+            dispatcher.cancel()
+            await coalescer.close()
+            await outbound.send({"type": "text-update", "content": f"\n[Error: {str(e)}]"})
+        finally:
+            dispatcher.cancel()
+
+    async def send_filler():
+        """
+        预估首段语音延迟（LLM 首 token + 首句 TTS）过长时，先发送一段预合成的填充语音
+        （排在本回合正式语音之前）；语音回合在识别出非空文本后才调用，静音或识别失败时不会播放
+        """
+        predicted = admission.estimate_ttfa(include_asr=False, include_queue=False)
+        if not filler.should_fill(predicted):
+            return
+        clip = await filler.pick(session_config["voice"], output_sample_rate())
+        if clip:
+            logger.debug("Sending filler audio", extra={"predicted_ttfa_ms": round(predicted * 1000), "sample": True})
+            await outbound.send({"type": "audio-chunk", "content": clip, "filler": True})
+
+    async def handle_text_input(user_text: str):
+        """处理一轮文本输入：回显、写入历史并生成回复"""
+        logger.info("User text input", extra={"chars": len(user_text)})
+        logger.debug("User text: %s", user_text)
+
+        # 发送用户消息给前端
+        await outbound.send({
+            "type": "user-message",
+            "content": user_text
+        })
+
+        # 添加用户消息到对话历史
+        add_to_history("user", user_text)
+
+        # 通知前端处理中
+        await outbound.send({"type": "status", "content": "processing"})
+        await send_filler()
+
+        # 处理LLM响应（使用完整的对话历史）
+        await generate_reply()
+
+        await outbound.send({"type": "status", "content": "idle"})
+
+    async def run_asr(audio) -> str:
+        """在线程池中识别（受 ASR 并发阶段限制），失败时返回空字符串"""
+        try:
+            async with asr_stage.slot():
+                user_text = await asyncio.to_thread(transcribe_audio, audio)
+            logger.info("ASR completed", extra={"chars": len(user_text)})
+            logger.debug("User said: %s", user_text)
+            return user_text
+        except Exception:
+            logger.exception("ASR error")
+            return ""
+
+    async def transcribe_webm() -> str:
+        """WebM 录音：落盘并转码为 WAV 后识别"""
+        # 生成唯一文件名并保存
+        request_id = str(uuid.uuid4())
+        temp_audio_path = f"temp_input_{request_id}.webm"
+
+        # 写入文件
+        audio_buffer.write_to(temp_audio_path)
+
+        # 清空缓冲区
+        audio_buffer.reset()
+
+        # 转换音频格式 (WebM -> WAV) 以解决 EBML header parsing failed 问题
+        # 浏览器录制的 WebM 有时没有完整的 Header，使用多重备选方案
+        wav_path = temp_audio_path.replace(".webm", ".wav")
+
+        try:
+            # 使用增强的音频转换函数
+            asr_input_path = await convert_audio_to_wav(temp_audio_path, wav_path)
+            if asr_input_path is None:
+                logger.error("All audio conversion methods failed, skipping ASR")
+                return ""
+            return await run_asr(asr_input_path)
+        finally:
+            # 清理临时文件
+            if os.path.exists(temp_audio_path):
+                os.remove(temp_audio_path)
+            if os.path.exists(wav_path):
+                os.remove(wav_path)
+
+    async def handle_audio_end():
+        """处理一轮语音输入：识别后生成回复"""
+        # 超限被拒收的录音直接丢弃
+        if audio_buffer.rejected:
+            logger.warning("Recording rejected, skipping ASR", extra={"reason": audio_buffer.overflow.reason})
+            audio_buffer.reset()
+            await outbound.send({"type": "status", "content": "idle"})
+            return
+
+        # 检查音频数据是否有效（最小长度检查）
+        if len(audio_buffer) < 1024:  # 至少1KB的音频数据
+            logger.warning("Audio buffer too small, skipping ASR", extra={"bytes": len(audio_buffer)})
+            # 清空缓冲区并跳过
+            audio_buffer.reset()
+            await outbound.send({"type": "status", "content": "idle"})
+            return
+
+        # 通知前端
+        await outbound.send({"type": "status", "content": "processing"})
+
+        if session_config["input_format"] == "webm":
+            user_text = await transcribe_webm()
+        else:
+            # PCM（Opus 已在接收时解码为 PCM）直接作为数组送入 ASR，无需容器解析与转码
+            audio = pcm16_to_float32(audio_buffer.getvalue())
+            audio_buffer.reset()
+            user_text = await run_asr(audio)
+
+        # 如果没听到说话，直接跳过
+        if not user_text.strip():
+            await outbound.send({"type": "status", "content": "idle"})
+            return
+
+        # 发送用户消息给前端（使用新的消息类型）
+        await outbound.send({
+            "type": "user-message",
+            "content": user_text
+        })
+
+        # 添加用户消息到对话历史
+        add_to_history("user", user_text)
+
+        await send_filler()
+        await generate_reply()
+
+        await outbound.send({"type": "status", "content": "idle"})
+
+    async def receive_audio(chunk: bytes):
+        """追加一个录音切片；Opus 包先解码为 PCM"""
+        if opus_decoder is not None:
+            try:
+                chunk = opus_decoder.decode(chunk)
+            except Exception as e:
+                logger.warning("Dropping undecodable Opus packet: %s", e, extra={"sample": True})
+                return
+        try:
+            audio_buffer.append(chunk)
+        except AudioBufferOverflow as e:
+            await outbound.send({"type": "error", "content": e.message})
+
+    # 每个会话内递增的回合编号（用于日志和性能剖析文件命名）
+    turn_id = 0
 
     try:
         while True:
-            data = await websocket.receive_text()
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            if capture is not None:
+                if frame.get("bytes") is not None:
+                    capture.record_bytes(frame["bytes"])
+                elif frame.get("text") is not None:
+                    capture.record_text(frame["text"])
+            # 二进制帧即录音切片（PCM 或 Opus 包），省去 base64 编解码
+            if frame.get("bytes") is not None:
+                await receive_audio(frame["bytes"])
+                continue
+            data = frame.get("text")
+            if data is None:
+                continue
             try:
                 message = json.loads(data)
             except json.JSONDecodeError:
-                print(f"❌ [{client_id}] Invalid JSON received")
+                logger.warning("Invalid JSON received")
                 continue
 
             if "type" not in message:
-                print(f"❌ [{client_id}] Message missing 'type' field")
+                logger.warning("Message missing 'type' field")
                 continue
             
             if message["type"] == "audio-chunk":
-                chunk = base64.b64decode(message["content"])
-                audio_buffer.extend(chunk)
+                await receive_audio(base64.b64decode(message["content"]))
             
+            elif message["type"] == "config":
+                # 会话参数协商
+                if "sample_rate" in message:
+                    try:
+                        session_config["sample_rate"] = (
+                            None if message["sample_rate"] is None
+                            else validate_output_sample_rate(message["sample_rate"])
+                        )
+                    except ValueError as e:
+                        await outbound.send({"type": "error", "content": f"Invalid config: {e}"})
+                        continue
+                if "voice" in message:
+                    try:
+                        session_config["voice"] = resolve_voice(message["voice"])
+                        # 选择音色时在后台预合成其填充语音，回合中不再合成
+                        filler.prerender(session_config["voice"])
+                    except ValueError as e:
+                        await outbound.send({"type": "error", "content": f"Invalid config: {e}"})
+                        continue
+                if "audio_transport" in message:
+                    try:
+                        session_config["audio_transport"] = validate_audio_transport(message["audio_transport"])
+                    except ValueError as e:
+                        await outbound.send({"type": "error", "content": f"Invalid config: {e}"})
+                        continue
+                if "input_format" in message:
+                    try:
+                        input_format = validate_input_format(message["input_format"])
+                    except ValueError as e:
+                        await outbound.send({"type": "error", "content": f"Invalid config: {e}"})
+                        continue
+                    if input_format != session_config["input_format"]:
+                        # 切换格式时丢弃未完成的录音
+                        audio_buffer.reset()
+                        session_config["input_format"] = input_format
+                        opus_decoder = OpusPacketDecoder() if input_format == "opus" else None
+                # 回执实际生效的采样率：高于模型原生采样率的请求按原生采样率输出
+                effective_config = {
+                    **session_config,
+                    "sample_rate": effective_sample_rate(session_config["sample_rate"], session_config["voice"]),
+                }
+                logger.info("Session config updated", extra={"config": effective_config})
+                await outbound.send({"type": "config", "content": effective_config})
+
             elif message["type"] == "text-input":
                 # 处理文本输入
                 user_text = message.get("content", "").strip()
                 if not user_text:
                     continue
 
-                print(f"👤 [{client_id}] User text: {user_text}")
+                turn_id += 1
+                bind_context(turn_id=turn_id)
+                async with admission.turn_slot(), profile_turn(client_id, turn_id):
+                    await handle_text_input(user_text)
 
-                # 发送用户消息给前端
-                await websocket.send_json({
-                    "type": "user-message",
-                    "content": user_text
-                })
-
-                # 添加用户消息到对话历史
-                add_to_history("user", user_text)
-
-                # 通知前端处理中
-                await websocket.send_json({"type": "status", "content": "processing"})
-
-                # 处理LLM响应（使用完整的对话历史）
-                sentence_buffer = ""
-                full_response = ""  # 收集完整回复以便添加到历史
-                punctuation = {",", "，", ".", "。", "?", "？", "!", "！", ";", "；", ":", "：", "\n"}
-
-                try:
-                    async for char in chat_stream(message_history):
-                        # 实时推流文字
-                        await websocket.send_json({"type": "text-update", "content": char})
-
-                        sentence_buffer += char
-                        full_response += char
-
-                        # 断句
-                        if char in punctuation:
-                            if len(sentence_buffer.strip()) > 1:
-                                print(f"🗣️ [{client_id}] Synthesizing: {sentence_buffer}")
-                                audio_base64 = await text_to_speech(sentence_buffer)
-
-                                if audio_base64:
-                                    await websocket.send_json({
-                                        "type": "audio-chunk",
-                                        "content": audio_base64
-                                    })
-                                sentence_buffer = ""
-
-                    # 处理剩余文本
-                    if sentence_buffer.strip():
-                         print(f"🗣️ [{client_id}] Synthesizing (Final): {sentence_buffer}")
-                         audio_base64 = await text_to_speech(sentence_buffer)
-                         if audio_base64:
-                            await websocket.send_json({
-                                "type": "audio-chunk",
-                                "content": audio_base64
-                            })
-
-                    # 将助手回复添加到对话历史
-                    if full_response.strip():
-                        add_to_history("assistant", full_response.strip())
-                        print(f"📝 [{client_id}] Added assistant response to history ({len(full_response)} chars)")
-
-                except Exception as e:
-                    print(f"❌ LLM/TTS Process Error: {e}")
-                    await websocket.send_json({"type": "text-update", "content": f"\n[Error: {str(e)}]"})
-
-                await websocket.send_json({"type": "status", "content": "idle"})
-            
             elif message["type"] == "audio-end":
-                # 生成唯一文件名并保存
-                request_id = str(uuid.uuid4())
-                temp_audio_path = f"temp_input_{request_id}.webm"
-
-                # 检查音频数据是否有效（最小长度检查）
-                if len(audio_buffer) < 1024:  # 至少1KB的音频数据
-                    print(f"⚠️ Audio buffer too small ({len(audio_buffer)} bytes), skipping ASR")
-                    # 清空缓冲区并跳过
-                    audio_buffer = bytearray()
-                    await websocket.send_json({"type": "status", "content": "idle"})
-                    continue
-
-                # 写入文件
-                with open(temp_audio_path, "wb") as f:
-                    f.write(audio_buffer)
-
-                # 清空缓冲区
-                audio_buffer = bytearray()
-
-                # 通知前端
-                await websocket.send_json({"type": "status", "content": "processing"})
-
-                # 转换音频格式 (WebM -> WAV) 以解决 EBML header parsing failed 问题
-                # 浏览器录制的 WebM 有时没有完整的 Header，使用多重备选方案
-                wav_path = temp_audio_path.replace(".webm", ".wav")
-
-                # 使用增强的音频转换函数
-                asr_input_path = await convert_audio_to_wav(temp_audio_path, wav_path)
-
-                if asr_input_path is None:
-                    print(f"❌ All audio conversion methods failed, skipping ASR")
-                    # 清理临时文件
-                    if os.path.exists(temp_audio_path):
-                        os.remove(temp_audio_path)
-                    audio_buffer = bytearray()
-                    await websocket.send_json({"type": "status", "content": "idle"})
-                    continue
-
-                # ASR
-                try:
-                    # 使用 asyncio.to_thread 运行同步的 Whisper 识别
-                    user_text = await asyncio.to_thread(transcribe_audio, asr_input_path)
-                    print(f"👂 [{client_id}] User said: {user_text}")
-                except Exception as e:
-                    print(f"❌ ASR Error: {e}")
-                    user_text = ""
-                
-                # 清理临时文件
-                if os.path.exists(temp_audio_path):
-                    os.remove(temp_audio_path)
-                if os.path.exists(wav_path):
-                    os.remove(wav_path)
-
-                # 如果没听到说话，直接跳过
-                if not user_text.strip():
-                    await websocket.send_json({"type": "status", "content": "idle"})
-                    continue
-
-                # 发送用户消息给前端（使用新的消息类型）
-                await websocket.send_json({
-                    "type": "user-message",
-                    "content": user_text
-                })
-
-                # 添加用户消息到对话历史
-                add_to_history("user", user_text)
-
-                sentence_buffer = ""
-                full_response = ""  # 收集完整回复以便添加到历史
-                punctuation = {",", "，", ".", "。", "?", "？", "!", "！", ";", "；", ":", "：", "\n"}
-
-                try:
-                    async for char in chat_stream(message_history):
-                        # 实时推流文字
-                        await websocket.send_json({"type": "text-update", "content": char})
-
-                        sentence_buffer += char
-                        full_response += char
-
-                        # 断句
-                        if char in punctuation:
-                            if len(sentence_buffer.strip()) > 1:
-                                print(f"🗣️ [{client_id}] Synthesizing: {sentence_buffer}")
-                                audio_base64 = await text_to_speech(sentence_buffer)
-
-                                if audio_base64:
-                                    await websocket.send_json({
-                                        "type": "audio-chunk",
-                                        "content": audio_base64
-                                    })
-                                sentence_buffer = ""
-
-                    # 处理剩余文本
-                    if sentence_buffer.strip():
-                         print(f"🗣️ [{client_id}] Synthesizing (Final): {sentence_buffer}")
-                         audio_base64 = await text_to_speech(sentence_buffer)
-                         if audio_base64:
-                            await websocket.send_json({
-                                "type": "audio-chunk",
-                                "content": audio_base64
-                            })
-
-                    # 将助手回复添加到对话历史
-                    if full_response.strip():
-                        add_to_history("assistant", full_response.strip())
-                        print(f"📝 [{client_id}] Added assistant response to history ({len(full_response)} chars)")
-
-                except Exception as e:
-                    print(f"❌ LLM/TTS Process Error: {e}")
-                    await websocket.send_json({"type": "text-update", "content": f"\n[Error: {str(e)}]"})
-
-                await websocket.send_json({"type": "status", "content": "idle"})
+                turn_id += 1
+                bind_context(turn_id=turn_id)
+                async with admission.turn_slot(), profile_turn(client_id, turn_id):
+                    await handle_audio_end()
 
     except WebSocketDisconnect:
-        print(f"👋 Client {client_id} disconnected")
-    except Exception as e:
-        print(f"❌ WebSocket Error: {e}")
+        logger.info("Client disconnected")
+    except OutboundClosed as e:
+        logger.warning("Client dropped: %s", e)
+    except Exception:
+        logger.exception("WebSocket error")
         try:
             await websocket.close()
         except:
-            pass
\ No newline at end of file
+            pass
+    finally:
+        admission.release_session()
+        if capture is not None:
+            capture.close()
+        # 释放录音缓冲占用的全局预算
+        audio_buffer.close()
+        await outbound.close()
+        logger.info("Outbound stats", extra=outbound.stats())
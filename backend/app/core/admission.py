@@ -0,0 +1,244 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 最大并发会话数与同时处理中的回合数
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "64"))
+MAX_ACTIVE_TURNS = int(os.getenv("MAX_ACTIVE_TURNS", "8"))
+# 首段语音延迟（time-to-first-audio）目标，预估超过时拒绝或排队新连接
+TTFA_SLO_MS = float(os.getenv("TTFA_SLO_MS", "4000"))
+# 超出容量时新连接最多排队等待的时长（秒），0 表示直接拒绝
+ADMISSION_QUEUE_TIMEOUT_S = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "0"))
+# 耗时估计的半衰期（秒）：长时间没有新样本时估计值逐渐衰减，避免一次慢请求长期影响准入
+ADMISSION_ESTIMATE_HALF_LIFE_S = float(os.getenv("ADMISSION_ESTIMATE_HALF_LIFE_S", "60"))
+
+_EWMA_ALPHA = 0.2
+# 离线请求等待空闲槽位的轮询间隔（秒）
+_OFFLINE_POLL_S = 0.05
+
+
+class Ewma:
+    """指数滑动平均"""
+
+    def __init__(self, alpha: float = _EWMA_ALPHA):
+        self.alpha = alpha
+        self.value = 0.0
+        self.count = 0
+        self.updated_at = time.monotonic()
+
+    def update(self, sample: float):
+        self.value = sample if self.count == 0 else self.alpha * sample + (1 - self.alpha) * self.value
+        self.count += 1
+        self.updated_at = time.monotonic()
+
+    def current(self, half_life: float = ADMISSION_ESTIMATE_HALF_LIFE_S) -> float:
+        """按距上次更新的时间衰减后的值，half_life<=0 时不衰减"""
+        if half_life <= 0:
+            return self.value
+        return self.value * 0.5 ** ((time.monotonic() - self.updated_at) / half_life)
+
+
+# 已注册的推理阶段（asr / tts），用于估算排队时间
+STAGES: Dict[str, "Stage"] = {}
+
+
+class Stage:
+    """
+    一个有并发上限的推理阶段：所有调用经 slot() 排队，
+    记录排队等待与执行耗时，用于预估新请求的延迟
+    """
+
+    def __init__(self, name: str, concurrency: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.offline_waiting = 0
+        self.wait_time = Ewma()
+        self.service_time = Ewma()
+        STAGES[name] = self
+
+    @asynccontextmanager
+    async def slot(self, offline: bool = False):
+        """
+        占用一个并发槽位。offline=True 用于离线请求（如 /asr/transcribe 的长音频分段）：
+        只在没有实时请求排队且有空闲槽位时才占用，不计入 waiting（不影响准入估算），
+        也不计入耗时统计（与实时回合的耗时不可比）
+        """
+        queued_at = time.perf_counter()
+        if offline:
+            self.offline_waiting += 1
+            try:
+                # 检查与占用之间没有 await，空闲的信号量 acquire() 不会挂起
+                while self.waiting or self._semaphore.locked():
+                    await asyncio.sleep(_OFFLINE_POLL_S)
+                await self._semaphore.acquire()
+            finally:
+                self.offline_waiting -= 1
+        else:
+            self.waiting += 1
+            try:
+                await self._semaphore.acquire()
+            finally:
+                self.waiting -= 1
+        started_at = time.perf_counter()
+        if not offline:
+            self.wait_time.update(started_at - queued_at)
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+            if not offline:
+                self.service_time.update(time.perf_counter() - started_at)
+
+    def estimate(self) -> float:
+        """新请求在该阶段的预估耗时（排队 + 执行，秒）"""
+        service = self.service_time.current()
+        ahead = max(0, self.active + self.waiting + 1 - self.concurrency)
+        queue_wait = ahead / self.concurrency * service
+        return queue_wait + service
+
+    def snapshot(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "waiting": self.waiting,
+            "offline_waiting": self.offline_waiting,
+            "wait_ms": round(self.wait_time.value * 1000),
+            "service_ms": round(self.service_time.current() * 1000),
+            "estimate_ms": round(self.estimate() * 1000),
+        }
+
+
+class AdmissionRejected(Exception):
+    """服务容量不足，拒绝新连接"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# LLM 首 token 延迟，由 llm.chat_stream 更新
+llm_ttft = Ewma()
+# 单个回合的总耗时
+turn_duration = Ewma()
+
+_sessions = 0
+_active_turns = 0
+_waiting_turns = 0
+_turn_semaphore = asyncio.Semaphore(MAX_ACTIVE_TURNS)
+
+
+def estimate_ttfa(include_asr: bool = True, include_queue: bool = True) -> float:
+    """
+    预估新语音回合的首段语音延迟（秒）：回合排队 + ASR + LLM 首 token + 首句 TTS。
+    文本回合不含 ASR（include_asr=False）；已在处理中的回合不含回合排队（include_queue=False）
+    """
+    estimate = llm_ttft.current()
+    for name in ("asr", "tts") if include_asr else ("tts",):
+        stage = STAGES.get(name)
+        if stage is not None:
+            estimate += stage.estimate()
+    ahead = _active_turns + _waiting_turns + 1 - MAX_ACTIVE_TURNS
+    if include_queue and ahead > 0:
+        estimate += ahead / MAX_ACTIVE_TURNS * turn_duration.current()
+    return estimate
+
+
+def _queueing() -> bool:
+    """是否已有回合或推理请求在排队"""
+    return _waiting_turns > 0 or any(stage.waiting > 0 for stage in STAGES.values())
+
+
+def check_capacity(sessions: bool = True) -> Optional[AdmissionRejected]:
+    """
+    容量检查：会话数已满（sessions=False 时不检查，供 REST 接口使用），
+    或已出现排队且预估首段语音延迟超出目标时返回 AdmissionRejected，否则返回 None。
+    没有排队时即使单次请求较慢也照常接入：此时拒绝并不能缩短任何人的延迟
+    """
+    if sessions and _sessions >= MAX_SESSIONS:
+        return AdmissionRejected("too many sessions", max(1.0, turn_duration.current()))
+    if not _queueing():
+        return None
+    ttfa = estimate_ttfa()
+    if ttfa * 1000 > TTFA_SLO_MS:
+        return AdmissionRejected(
+            f"estimated time to first audio {ttfa * 1000:.0f}ms exceeds {TTFA_SLO_MS:.0f}ms",
+            max(1.0, ttfa - TTFA_SLO_MS / 1000),
+        )
+    return None
+
+
+async def admit_session(on_queued=None):
+    """
+    新连接准入：容量允许时登记会话并返回；否则在 ADMISSION_QUEUE_TIMEOUT_S 内排队重试
+    （首次排队时调用 on_queued(retry_after)），超时抛出 AdmissionRejected
+    """
+    global _sessions
+    give_up_at = time.monotonic() + ADMISSION_QUEUE_TIMEOUT_S
+    notified = False
+    while True:
+        rejection = check_capacity()
+        if rejection is None:
+            _sessions += 1
+            return
+        remaining = give_up_at - time.monotonic()
+        if remaining <= 0:
+            logger.warning("Session rejected: %s", rejection.reason, extra={"retry_after": math.ceil(rejection.retry_after)})
+            raise rejection
+        if on_queued is not None and not notified:
+            notified = True
+            await on_queued(rejection.retry_after)
+        await asyncio.sleep(min(0.5, remaining))
+
+
+def release_session():
+    global _sessions
+    _sessions = max(0, _sessions - 1)
+
+
+@asynccontextmanager
+async def turn_slot():
+    """限制同时处理的回合数，超出时排队"""
+    global _active_turns, _waiting_turns
+    _waiting_turns += 1
+    try:
+        await _turn_semaphore.acquire()
+    finally:
+        _waiting_turns -= 1
+    _active_turns += 1
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        _active_turns -= 1
+        _turn_semaphore.release()
+        turn_duration.update(time.perf_counter() - started_at)
+
+
+def snapshot() -> dict:
+    """当前容量与负载"""
+    ttfa = estimate_ttfa()
+    return {
+        "sessions": _sessions,
+        "max_sessions": MAX_SESSIONS,
+        "active_turns": _active_turns,
+        "waiting_turns": _waiting_turns,
+        "max_active_turns": MAX_ACTIVE_TURNS,
+        "stages": {name: stage.snapshot() for name, stage in STAGES.items()},
+        "llm_ttft_ms": round(llm_ttft.value * 1000),
+        "turn_duration_ms": round(turn_duration.value * 1000),
+        "ttfa_estimate_ms": round(ttfa * 1000),
+        "ttfa_slo_ms": TTFA_SLO_MS,
+        "accepting": check_capacity() is None,
+    }
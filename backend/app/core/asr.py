@@ -1,14 +1,29 @@
 import os
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
 from faster_whisper import WhisperModel
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+from app.core.profiling import inference_profile
+from app.core.admission import Stage
+
+logger = logging.getLogger(__name__)
 
 # 模型大小：base, small, medium, large-v3
 # 建议先用 base 测试，速度快
 MODEL_SIZE = "base" 
+# 并行识别的 worker 数：多个线程同时调用 transcribe 时才能真正并行
+ASR_NUM_WORKERS = max(1, int(os.getenv("ASR_NUM_WORKERS", "2")))
+# 长音频按 VAD 切分后每段的最大时长（秒），Whisper 单窗口为 30 秒
+ASR_CHUNK_MAX_S = float(os.getenv("ASR_CHUNK_MAX_S", "30"))
+SAMPLE_RATE = 16000
+# 所有 ASR 调用（语音回合与 /asr/transcribe）共用的并发阶段，用于准入控制的排队估算
+asr_stage = Stage("asr", ASR_NUM_WORKERS)
 # 强制优先使用 CUDA
 import torch
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
-print(f"[INFO] Loading Whisper model ({MODEL_SIZE}) on {device}...")
+logger.info("Loading Whisper model (%s) on %s...", MODEL_SIZE, device)
 try:
     # 根据设备选择合适的compute_type
     if device == "cuda":
@@ -16,43 +31,95 @@ try:
     else:
         compute_type = "int8_float32"  # CPU上使用int8_float32或float32
 
-    model = WhisperModel(MODEL_SIZE, device=device, compute_type=compute_type)
-    print(f"[OK] Whisper model loaded with compute_type={compute_type}.")
+    model = WhisperModel(MODEL_SIZE, device=device, compute_type=compute_type, num_workers=ASR_NUM_WORKERS)
+    logger.info("Whisper model loaded with compute_type=%s", compute_type)
 except Exception as e:
-    print(f"[ERROR] Failed to load Whisper: {e}")
+    logger.error("Failed to load Whisper: %s", e)
     # 尝试使用默认compute_type
     try:
-        model = WhisperModel(MODEL_SIZE, device=device)
-        print("[OK] Whisper model loaded with default compute_type.")
+        model = WhisperModel(MODEL_SIZE, device=device, num_workers=ASR_NUM_WORKERS)
+        logger.info("Whisper model loaded with default compute_type")
     except Exception as e2:
-        print(f"[ERROR] Fallback also failed: {e2}")
+        logger.error("Fallback also failed: %s", e2)
         model = None
 
-def transcribe_audio(file_path: str) -> str:
+def transcribe_audio(audio: Union[str, np.ndarray]) -> str:
+    """识别一段录音：audio 为音频文件路径，或 16kHz 单声道 float32 数组（免去容器解析与转码）"""
     if not model:
         return "Error: ASR model not loaded."
 
     # 优化识别参数以提高灵敏度
     # 根据日志调整：log_prob_threshold从-1.0降到-2.0，no_speech_threshold从0.6升到0.7
-    segments, info = model.transcribe(
-        file_path,
-        beam_size=5,
-        language="zh",
-        no_speech_threshold=0.7,  # 提高阈值，减少误判为无语音
-        log_prob_threshold=-2.0,  # 降低阈值，接受更多低置信度音频
-        condition_on_previous_text=False,  # 短语音不需要上下文
-        vad_filter=True,  # 启用VAD过滤，改善语音检测
-        vad_parameters=dict(min_silence_duration_ms=500)  # VAD参数
-    )
+    # 被剖析的回合会记录推理 trace
+    with inference_profile("asr"):
+        segments, info = model.transcribe(
+            audio,
+            beam_size=5,
+            language="zh",
+            no_speech_threshold=0.7,  # 提高阈值，减少误判为无语音
+            log_prob_threshold=-2.0,  # 降低阈值，接受更多低置信度音频
+            condition_on_previous_text=False,  # 短语音不需要上下文
+            vad_filter=True,  # 启用VAD过滤，改善语音检测
+            vad_parameters=dict(min_silence_duration_ms=500)  # VAD参数
+        )
 
-    text = ""
-    for segment in segments:
-        text += segment.text
+        # segments 是惰性生成器，解码发生在迭代过程中
+        text = ""
+        for segment in segments:
+            text += segment.text
 
     # 记录识别结果
     if text.strip():
-        print(f"[OK] ASR识别成功: '{text.strip()}'")
+        logger.debug("ASR识别成功: %s", text.strip())
     else:
-        print(f"[WARN] ASR未识别到语音内容")
+        logger.info("ASR未识别到语音内容")
+
+    return text.strip()
+
+
+def split_on_vad(audio: np.ndarray, max_chunk_s: float = ASR_CHUNK_MAX_S) -> List[Tuple[int, int]]:
+    """
+    按 VAD 检测到的语音段切分长音频（16kHz 单声道 float32），
+    相邻语音段合并为不超过 max_chunk_s 的块，返回 [(start_sample, end_sample), ...]
+    """
+    max_samples = int(max_chunk_s * SAMPLE_RATE)
+    speech = get_speech_timestamps(
+        audio,
+        VadOptions(min_silence_duration_ms=500, max_speech_duration_s=max_chunk_s),
+    )
 
-    return text.strip()
\ No newline at end of file
+    chunks = []
+    for ts in speech:
+        if chunks and ts["end"] - chunks[-1][0] <= max_samples:
+            chunks[-1] = (chunks[-1][0], ts["end"])
+        else:
+            chunks.append((ts["start"], ts["end"]))
+    return chunks
+
+
+def transcribe_chunk(audio: np.ndarray, offset_s: float = 0.0, language: Optional[str] = "zh") -> List[Dict]:
+    """
+    识别一个已切好的音频块，返回带绝对时间戳的分段列表
+    （可在多个线程中并发调用，并行度由 ASR_NUM_WORKERS 决定）
+    """
+    if not model:
+        raise RuntimeError("ASR model not loaded.")
+
+    segments, info = model.transcribe(
+        audio,
+        beam_size=5,
+        language=language,
+        no_speech_threshold=0.7,
+        log_prob_threshold=-2.0,
+        condition_on_previous_text=False,  # 各块独立识别，便于并行
+        vad_filter=False,  # 已按 VAD 切分
+    )
+    return [
+        {
+            "start": round(offset_s + segment.start, 2),
+            "end": round(offset_s + segment.end, 2),
+            "text": segment.text.strip(),
+        }
+        for segment in segments
+        if segment.text.strip()
+    ]
@@ -0,0 +1,255 @@
+import os
+import struct
+import logging
+import functools
+import threading
+import subprocess
+import numpy as np
+import torch
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+# 允许客户端请求的输出采样率范围；高于模型原生采样率时按原生采样率输出（不升采样）
+MIN_OUTPUT_SAMPLE_RATE = 8000
+MAX_OUTPUT_SAMPLE_RATE = 48000
+
+# 客户端可协商的录音输入格式：
+# webm  浏览器 MediaRecorder 录制的 WebM/Opus 容器，需经 ffmpeg 转码（默认）
+# pcm16 16kHz 单声道 16 位小端 PCM，直接送入 ASR
+# opus  16kHz 单声道裸 Opus 包（每帧一个包），接收时逐包解码为 PCM（需要 opuslib）
+INPUT_FORMATS = ("webm", "pcm16", "opus")
+PCM_SAMPLE_RATE = 16000
+# Opus 单包最长 120ms
+_OPUS_MAX_FRAME_SAMPLES = PCM_SAMPLE_RATE * 120 // 1000
+
+_resampler_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=32)
+def _build_resampler(orig_freq: int, new_freq: int):
+    # 延迟导入：torchaudio 的后端设置在 tts.py 中完成
+    import torchaudio
+    return torchaudio.transforms.Resample(orig_freq=orig_freq, new_freq=new_freq)
+
+
+def get_resampler(orig_freq: int, new_freq: int):
+    """
+    获取 (orig_freq, new_freq) 对应的重采样器。
+    Resample 构造时会计算 sinc 插值核，代价远高于一次重采样本身，
+    因此按采样率对缓存复用；重采样器无内部状态，可跨线程共享。
+    """
+    with _resampler_lock:
+        return _build_resampler(int(orig_freq), int(new_freq))
+
+
+def resample(waveform: torch.Tensor, orig_freq: int, new_freq: int) -> torch.Tensor:
+    """把 [channels, samples] 波形从 orig_freq 重采样到 new_freq"""
+    if not new_freq or int(orig_freq) == int(new_freq):
+        return waveform
+    resampler = get_resampler(orig_freq, new_freq)
+    with torch.inference_mode():
+        return resampler(waveform.float())
+
+
+def validate_output_sample_rate(sample_rate) -> int:
+    """校验客户端请求的输出采样率，非法时抛出 ValueError"""
+    if isinstance(sample_rate, bool) or not isinstance(sample_rate, int):
+        raise ValueError("sample_rate must be an integer")
+    if not MIN_OUTPUT_SAMPLE_RATE <= sample_rate <= MAX_OUTPUT_SAMPLE_RATE:
+        raise ValueError(
+            f"sample_rate must be between {MIN_OUTPUT_SAMPLE_RATE} and {MAX_OUTPUT_SAMPLE_RATE}"
+        )
+    return sample_rate
+
+
+# 下行语音的传输方式：json（audio-chunk 消息内 base64，默认）或 binary（WAV 原样作为二进制帧）
+AUDIO_TRANSPORTS = ("json", "binary")
+
+# 44 字节 PCM WAV 头：RIFF 块 + fmt 子块 + data 子块头
+WAV_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+# encode_wav_pcm16 每次缩放的帧数（暂存区 8192 帧 × 4 字节 × 声道数）
+_ENCODE_BLOCK_FRAMES = 8192
+
+
+def encode_wav_pcm16(audio, sample_rate: int) -> bytearray:
+    """
+    把 [-1, 1] 浮点波形（torch 张量或 numpy 数组，[channels, samples] 或 [samples]）编码为 16 位 PCM WAV。
+    输出缓冲区一次分配：头部用 pack_into 原地写入，采样按块缩放、裁剪后直接写入缓冲区
+    （只额外占用一个 _ENCODE_BLOCK_FRAMES 帧的浮点暂存区，不产生与整段音频等长的临时数组），
+    返回值可直接作为二进制帧发送，无需 BytesIO 中转。
+    """
+    if isinstance(audio, torch.Tensor):
+        # CPU float32 张量的 numpy() 共享内存，不复制
+        audio = audio.detach().cpu().numpy()
+    samples = np.asarray(audio, dtype=np.float32)
+    if samples.ndim == 1:
+        samples = samples[np.newaxis, :]
+    channels, frames = samples.shape
+    data_size = channels * frames * 2
+
+    buffer = bytearray(WAV_HEADER.size + data_size)
+    WAV_HEADER.pack_into(
+        buffer, 0,
+        b"RIFF", WAV_HEADER.size - 8 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * channels * 2, channels * 2, 16,
+        b"data", data_size,
+    )
+    pcm = np.frombuffer(buffer, dtype="<i2", offset=WAV_HEADER.size).reshape(frames, channels)
+    # 多声道按帧交错（转置视图，不复制）；每块在暂存区内缩放、裁剪后转换写入输出缓冲区
+    interleaved = samples.T
+    scratch = np.empty((min(frames, _ENCODE_BLOCK_FRAMES), channels), dtype=np.float32)
+    for start in range(0, frames, _ENCODE_BLOCK_FRAMES):
+        block = interleaved[start:start + _ENCODE_BLOCK_FRAMES]
+        scaled = scratch[:len(block)]
+        np.multiply(block, 32767.0, out=scaled)
+        np.clip(scaled, -32768.0, 32767.0, out=scaled)
+        np.copyto(pcm[start:start + len(block)], scaled, casting="unsafe")
+    return buffer
+
+
+def validate_audio_transport(transport) -> str:
+    if transport not in AUDIO_TRANSPORTS:
+        raise ValueError(f"audio_transport must be one of {', '.join(AUDIO_TRANSPORTS)}")
+    return transport
+
+
+def validate_input_format(input_format) -> str:
+    """校验客户端声明的录音输入格式，非法或缺少依赖时抛出 ValueError"""
+    if input_format not in INPUT_FORMATS:
+        raise ValueError(f"input_format must be one of {', '.join(INPUT_FORMATS)}")
+    if input_format == "opus":
+        try:
+            import opuslib  # noqa: F401
+        except ImportError:
+            raise ValueError("opus input requires opuslib on the server, use pcm16 instead")
+    return input_format
+
+
+def pcm16_to_float32(data: bytes) -> np.ndarray:
+    """16 位小端 PCM 转为 Whisper 需要的 [-1, 1] float32 数组（丢弃末尾不完整的采样）"""
+    usable = len(data) - len(data) % 2
+    return np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+
+class OpusPacketDecoder:
+    """逐包解码 16kHz 单声道 Opus 为 16 位 PCM（每个会话一个实例，解码器有状态）"""
+
+    def __init__(self):
+        import opuslib
+        self._decoder = opuslib.Decoder(PCM_SAMPLE_RATE, 1)
+
+    def decode(self, packet: bytes) -> bytes:
+        return self._decoder.decode(packet, _OPUS_MAX_FRAME_SAMPLES)
+
+
+async def convert_audio_to_wav(input_path: str, output_path: str = None) -> str:
+    """
+    将音频文件转换为 WAV 格式，支持多种方法
+    返回转换后的 WAV 文件路径，如果失败则返回原始文件路径
+    """
+    if output_path is None:
+        output_path = input_path.replace(".webm", ".wav").replace(".mp3", ".wav").replace(".ogg", ".wav")
+
+    # 方法1: 使用本地 ffmpeg 工具
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    local_ffmpeg = os.path.join(project_root, "tools", "ffmpeg", "ffmpeg.exe")
+    ffmpeg_cmd = local_ffmpeg if os.path.exists(local_ffmpeg) else "ffmpeg"
+
+    # 检查输入文件是否存在且大小合理
+    if not os.path.exists(input_path):
+        logger.error("Input file does not exist: %s", input_path)
+    else:
+        file_size = os.path.getsize(input_path)
+        if file_size < 1024:  # 小于1KB的文件可能无效
+            logger.warning("Input file too small (%d bytes), may be invalid", file_size)
+
+    # 重试机制
+    max_retries = 2
+    for attempt in range(max_retries):
+        try:
+            # 尝试使用 ffmpeg 转换
+            subprocess.run(
+                [ffmpeg_cmd, "-y", "-i", input_path, "-ac", "1", "-ar", "16000", output_path],
+                check=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=30
+            )
+            logger.debug("FFmpeg conversion successful (attempt %d/%d): %s -> %s", attempt + 1, max_retries, input_path, output_path)
+            return output_path
+        except (subprocess.TimeoutExpired, subprocess.CalledProcessError, FileNotFoundError, OSError) as e:
+            logger.warning("FFmpeg conversion failed (attempt %d/%d): %s", attempt + 1, max_retries, e)
+            if attempt == max_retries - 1:
+                logger.error("All ffmpeg attempts failed")
+            else:
+                # 等待片刻后重试
+                import time
+                time.sleep(0.5)
+
+    # 方法2: 尝试使用 pydub (如果可用)
+    try:
+        # 设置 pydub 使用的 ffmpeg 路径
+        import pydub
+        # 确保使用我们本地的 ffmpeg
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        local_ffmpeg_dir = os.path.join(project_root, "tools", "ffmpeg")
+        local_ffmpeg = os.path.join(local_ffmpeg_dir, "ffmpeg.exe")
+        local_ffprobe = os.path.join(local_ffmpeg_dir, "ffprobe.exe")
+
+        # 设置环境变量和 pydub 配置
+        os.environ["PATH"] = local_ffmpeg_dir + os.pathsep + os.environ.get("PATH", "")
+        pydub.AudioSegment.converter = local_ffmpeg
+        pydub.AudioSegment.ffprobe = local_ffprobe if os.path.exists(local_ffprobe) else None
+
+        from pydub import AudioSegment
+        # 尝试根据扩展名读取
+        ext = os.path.splitext(input_path)[1].lower()
+        if ext == ".webm":
+            audio = AudioSegment.from_file(input_path, format="webm")
+        elif ext == ".mp3":
+            audio = AudioSegment.from_file(input_path, format="mp3")
+        else:
+            # 尝试自动检测
+            audio = AudioSegment.from_file(input_path)
+
+        # 转换为单声道，16000Hz采样率
+        audio = audio.set_channels(1).set_frame_rate(16000)
+        audio.export(output_path, format="wav")
+        logger.info("Pydub conversion successful: %s -> %s", input_path, output_path)
+        return output_path
+    except Exception as e:
+        logger.warning("Pydub conversion failed: %s", e, exc_info=True)
+
+    # 方法3: 如果原始文件已经是.wav或无法转换，返回原始路径
+    # 检查文件是否有效
+    if input_path.lower().endswith('.wav'):
+        try:
+            # 验证WAV文件是否可以读取
+            data, samplerate = sf.read(input_path)
+            logger.info("Using original WAV file: %s", input_path)
+            return input_path
+        except Exception as e:
+            logger.error("WAV file validation failed: %s", e)
+
+    # 方法4: 尝试使用 torchaudio (如果可用)
+    try:
+        import torchaudio
+        # 使用 torchaudio 加载并保存为 WAV
+        waveform, sample_rate = torchaudio.load(input_path)
+        # 转换为单声道（如果需要）
+        if waveform.shape[0] > 1:
+            waveform = waveform.mean(dim=0, keepdim=True)
+        # 重采样到 16000 Hz（如果需要）
+        if sample_rate != 16000:
+            waveform = resample(waveform, sample_rate, 16000)
+        # 保存为 WAV
+        torchaudio.save(output_path, waveform, 16000)
+        logger.info("Torchaudio conversion successful: %s -> %s", input_path, output_path)
+        return output_path
+    except Exception as e:
+        logger.warning("Torchaudio conversion failed: %s", e, exc_info=True)
+
+    # 所有方法都失败
+    logger.error("All audio conversion methods failed for: %s", input_path)
+    return None
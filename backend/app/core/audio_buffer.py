@@ -0,0 +1,174 @@
+import os
+import logging
+import time
+import shutil
+import tempfile
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 单个会话一次录音的上限（时长按收到第一个切片起的墙钟时间计算）
+AUDIO_MAX_SECONDS = float(os.getenv("AUDIO_MAX_SECONDS", "120"))
+AUDIO_MAX_BYTES = int(float(os.getenv("AUDIO_MAX_MB", "16")) * 1024 * 1024)
+# 超过该大小后缓冲区落盘到临时文件
+AUDIO_SPILL_BYTES = int(float(os.getenv("AUDIO_SPILL_KB", "512")) * 1024)
+# 所有会话驻留内存的音频总量，超过后新数据直接落盘
+AUDIO_MEMORY_BUDGET = int(float(os.getenv("AUDIO_MEMORY_BUDGET_MB", "256")) * 1024 * 1024)
+# 所有会话缓冲的音频总量（含已落盘部分），超过后拒收
+AUDIO_GLOBAL_BUDGET = int(float(os.getenv("AUDIO_GLOBAL_BUDGET_MB", "2048")) * 1024 * 1024)
+# 超限策略: truncate 保留已收到的部分继续识别, reject 丢弃整段录音
+AUDIO_OVERFLOW_POLICY = os.getenv("AUDIO_OVERFLOW_POLICY", "truncate").lower()
+
+_budget_lock = threading.Lock()
+_memory_bytes = 0
+_total_bytes = 0
+
+
+class AudioBufferOverflow(Exception):
+    """录音超出会话或全局限制"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+
+
+def get_usage() -> dict:
+    """返回当前所有会话的缓冲占用情况"""
+    with _budget_lock:
+        return {
+            "memory_bytes": _memory_bytes,
+            "total_bytes": _total_bytes,
+            "memory_budget": AUDIO_MEMORY_BUDGET,
+            "global_budget": AUDIO_GLOBAL_BUDGET,
+        }
+
+
+class AudioIngestBuffer:
+    """
+    单个会话的录音缓冲区：
+    1. 小录音保存在内存中，超过 AUDIO_SPILL_BYTES 或全局内存预算时转存到临时文件
+    2. 超过时长/大小/全局预算时按 AUDIO_OVERFLOW_POLICY 截断或拒收
+    3. 超限后本次录音剩余的切片全部丢弃，直到 reset()
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = AUDIO_MAX_BYTES,
+        max_seconds: float = AUDIO_MAX_SECONDS,
+        spill_bytes: int = AUDIO_SPILL_BYTES,
+        policy: str = AUDIO_OVERFLOW_POLICY,
+    ):
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.spill_bytes = spill_bytes
+        self.policy = policy if policy in ("truncate", "reject") else "truncate"
+        self._file = None
+        self.size = 0
+        self.spilled = False
+        self.started_at: Optional[float] = None
+        self.overflow: Optional[AudioBufferOverflow] = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def rejected(self) -> bool:
+        """本次录音是否已被整段拒收"""
+        return self.overflow is not None and self.policy == "reject"
+
+    def append(self, chunk: bytes) -> bool:
+        """
+        追加一个音频切片。
+        返回是否接收；首次超限时抛出 AudioBufferOverflow（调用方据此通知客户端），
+        之后的切片静默丢弃。
+        """
+        global _memory_bytes, _total_bytes
+        if self.overflow is not None:
+            return False
+        if not chunk:
+            return True
+
+        now = time.monotonic()
+        if self.started_at is None:
+            self.started_at = now
+
+        if now - self.started_at > self.max_seconds:
+            self._fail("duration", f"Recording exceeds {self.max_seconds:.0f}s limit")
+        if self.size + len(chunk) > self.max_bytes:
+            self._fail("size", f"Recording exceeds {self.max_bytes // (1024 * 1024)}MB limit")
+
+        with _budget_lock:
+            if _total_bytes + len(chunk) > AUDIO_GLOBAL_BUDGET:
+                over_budget = True
+            else:
+                over_budget = False
+                _total_bytes += len(chunk)
+                spill = not self.spilled and (
+                    self.size + len(chunk) > self.spill_bytes
+                    or _memory_bytes + len(chunk) > AUDIO_MEMORY_BUDGET
+                )
+                if not self.spilled and not spill:
+                    _memory_bytes += len(chunk)
+        if over_budget:
+            self._fail("server_busy", "Server audio buffer budget exhausted, please retry later")
+
+        if self._file is None:
+            # max_size=0: 不自动落盘，由 _spill() 显式控制以便记账
+            self._file = tempfile.SpooledTemporaryFile(max_size=0)
+        if spill:
+            self._spill()
+        self._file.write(chunk)
+        self.size += len(chunk)
+        return True
+
+    def _spill(self):
+        global _memory_bytes
+        self._file.rollover()
+        with _budget_lock:
+            _memory_bytes -= self.size
+        self.spilled = True
+        logger.info("Audio buffer spilled to disk", extra={"bytes": self.size})
+
+    def _fail(self, reason: str, message: str):
+        self.overflow = AudioBufferOverflow(reason, message)
+        logger.warning("Audio buffer overflow: %s", message, extra={"reason": reason})
+        if self.policy == "reject":
+            self._release()
+        raise self.overflow
+
+    def write_to(self, path: str):
+        """把缓冲内容写入文件"""
+        with open(path, "wb") as f:
+            if self._file is not None:
+                self._file.seek(0)
+                shutil.copyfileobj(self._file, f)
+
+    def getvalue(self) -> bytes:
+        """读出全部缓冲内容"""
+        if self._file is None:
+            return b""
+        self._file.seek(0)
+        return self._file.read()
+
+    def _release(self):
+        global _memory_bytes, _total_bytes
+        with _budget_lock:
+            _total_bytes -= self.size
+            if not self.spilled:
+                _memory_bytes -= self.size
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self.size = 0
+        self.spilled = False
+
+    def reset(self):
+        """释放当前录音，准备接收下一段"""
+        self._release()
+        self.started_at = None
+        self.overflow = None
+
+    def close(self):
+        self.reset()
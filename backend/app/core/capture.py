@@ -0,0 +1,164 @@
+import os
+import gzip
+import time
+import queue
+import random
+import struct
+import logging
+import threading
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 会话流量录制目录，为空时不录制；相对路径基于 backend 目录
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "")
+if CAPTURE_DIR and not os.path.isabs(CAPTURE_DIR):
+    CAPTURE_DIR = str(Path(__file__).parent.parent.parent / CAPTURE_DIR)
+# 被录制的会话比例
+CAPTURE_SAMPLE_RATE = float(os.getenv("CAPTURE_SAMPLE_RATE", "1.0"))
+# 最多保留的录制文件数，超出时删除最旧的
+CAPTURE_MAX_FILES = int(os.getenv("CAPTURE_MAX_FILES", "500"))
+# 待写入记录数上限，磁盘跟不上时放弃录制超出的会话，不占用无限内存
+CAPTURE_QUEUE_SIZE = int(os.getenv("CAPTURE_QUEUE_SIZE", "10000"))
+
+# 文件格式（gzip 压缩）：
+#   MAGIC
+#   记录 * N：<dBI 头（距会话开始的秒数, 类型, 载荷长度）+ 载荷
+MAGIC = b"AURCAP1\n"
+RECORD_HEADER = struct.Struct("<dBI")
+KIND_TEXT = 0  # 文本帧（UTF-8 JSON）
+KIND_BINARY = 1  # 二进制帧（PCM/Opus 录音切片）
+KIND_CLOSE = 2  # 客户端断开
+
+
+class _Writer(threading.Thread):
+    """后台写线程：建文件、清理旧文件、压缩与磁盘 IO 都不占用事件循环"""
+
+    def __init__(self, max_pending: int = CAPTURE_QUEUE_SIZE):
+        super().__init__(name="capture-writer", daemon=True)
+        self.queue: "queue.Queue" = queue.Queue()
+        self.max_pending = max(1, max_pending)
+
+    def submit(self, capture: "SessionCapture", data: Optional[bytes], force: bool = False) -> bool:
+        """
+        入队一条记录（data 为 None 表示关闭文件）；积压达到上限时丢弃并返回 False。
+        断开记录与关闭标记（force=True）总是入队，每个会话各至多一条
+        """
+        if not force and self.queue.qsize() >= self.max_pending:
+            return False
+        self.queue.put((capture, data))
+        return True
+
+    def run(self):
+        while True:
+            capture, data = self.queue.get()
+            if capture._failed:
+                continue
+            try:
+                if capture._handle is None:
+                    capture._open()
+                if data is None:
+                    capture._handle.close()
+                else:
+                    capture._handle.write(data)
+            except Exception as e:
+                # 出错后放弃该会话的后续记录
+                capture._failed = True
+                logger.warning("Capture write failed: %s", e, extra={"path": capture.path})
+                if capture._handle is not None:
+                    try:
+                        capture._handle.close()
+                    except Exception:
+                        pass
+
+
+_writer: Optional[_Writer] = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer() -> _Writer:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = _Writer()
+            _writer.start()
+        return _writer
+
+
+def _prune():
+    files = sorted(Path(CAPTURE_DIR).glob("*.cap.gz"), key=lambda p: p.stat().st_mtime)
+    for path in files[:max(0, len(files) - CAPTURE_MAX_FILES)]:
+        path.unlink(missing_ok=True)
+
+
+class SessionCapture:
+    """单个会话的录制：按到达时间记录每个入站帧"""
+
+    def __init__(self, client_id: str):
+        self.path = os.path.join(CAPTURE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{client_id}.cap.gz")
+        self._writer = _get_writer()
+        # 文件由写线程在处理第一条记录时创建
+        self._handle = None
+        self._failed = False
+        self._started_at = time.monotonic()
+        self._closed = False
+        self.records = 0
+        self._writer.submit(self, MAGIC)
+
+    def _open(self):
+        """在写线程中调用：清理旧文件并创建本会话的录制文件"""
+        os.makedirs(CAPTURE_DIR, exist_ok=True)
+        _prune()
+        self._handle = gzip.open(self.path, "wb", compresslevel=6)
+
+    def _record(self, kind: int, payload: bytes, force: bool = False):
+        if self._closed:
+            return
+        offset = time.monotonic() - self._started_at
+        if not self._writer.submit(self, RECORD_HEADER.pack(offset, kind, len(payload)) + payload, force):
+            # 写入积压：停止录制本会话，已写入的部分仍可回放（截断处视为结束）
+            logger.warning("Capture queue full, stopping capture", extra={"path": self.path, "records": self.records})
+            self._closed = True
+            self._writer.submit(self, None, force=True)
+            return
+        self.records += 1
+
+    def record_text(self, text: str):
+        self._record(KIND_TEXT, text.encode("utf-8"))
+
+    def record_bytes(self, data: bytes):
+        self._record(KIND_BINARY, data)
+
+    def close(self):
+        """记录断开时间并关闭文件"""
+        if self._closed:
+            return
+        self._record(KIND_CLOSE, b"", force=True)
+        self._closed = True
+        self._writer.submit(self, None, force=True)
+        logger.info("Session captured", extra={"path": self.path, "records": self.records})
+
+
+def start_capture(client_id: str) -> Optional[SessionCapture]:
+    """录制开启且本会话被抽中时返回 SessionCapture，否则返回 None"""
+    if not CAPTURE_DIR or random.random() >= CAPTURE_SAMPLE_RATE:
+        return None
+    return SessionCapture(client_id)
+
+
+def read_capture(path: str) -> Iterator[Tuple[float, int, bytes]]:
+    """按顺序读取录制文件，逐条返回 (offset_s, kind, payload)"""
+    with gzip.open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a session capture")
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                # 服务异常退出时文件可能在记录中间截断
+                return
+            offset, kind, length = RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield offset, kind, payload
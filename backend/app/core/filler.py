@@ -0,0 +1,94 @@
+import os
+import base64
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+import torch
+
+from app.core.audio import encode_wav_pcm16, resample
+from app.core.tts import synthesize
+
+logger = logging.getLogger(__name__)
+
+# 填充语音文本（| 分隔），为空时关闭
+FILLER_TEXTS = [t.strip() for t in os.getenv("FILLER_TEXTS", "嗯。|好的，|让我想想。").split("|") if t.strip()]
+# 预估首段语音延迟超过该值（毫秒）时先播放一段填充语音
+FILLER_THRESHOLD_MS = float(os.getenv("FILLER_THRESHOLD_MS", "1500"))
+
+# 已编码的 (voice, sample_rate, 序号) 最多保留的条数
+_MAX_ENCODED = 64
+
+# voice -> [(波形, 模型采样率)]；每个音色只合成一次，其他采样率由此重采样
+_clips: Dict[str, List[Tuple[torch.Tensor, int]]] = {}
+_rendering: Dict[str, asyncio.Task] = {}
+# 合成失败的音色，不再重试，避免每个回合重复占用 TTS
+_failed: Set[str] = set()
+# (voice, sample_rate, 序号) -> base64 WAV，LRU
+_encoded: "OrderedDict[Tuple[str, Optional[int], int], str]" = OrderedDict()
+
+
+async def _render(voice: str):
+    clips = []
+    try:
+        for text in FILLER_TEXTS:
+            audio, model_rate = await synthesize(text, voice)
+            if audio is not None:
+                clips.append((audio, model_rate))
+    except Exception as e:
+        logger.warning("Filler clip synthesis failed: %s", e, extra={"voice": voice})
+    if clips:
+        _clips[voice] = clips
+        logger.info("Filler clips rendered", extra={"voice": voice, "clips": len(clips)})
+    else:
+        _failed.add(voice)
+        logger.warning("Filler clips could not be rendered", extra={"voice": voice})
+    _rendering.pop(voice, None)
+
+
+def prerender(voice: str) -> Optional[asyncio.Task]:
+    """
+    在后台合成 voice 的填充语音：仅在启动时和会话选择音色时调用，不在回合中触发；
+    已有、正在合成或曾经失败时不重复
+    """
+    if not FILLER_TEXTS or voice in _clips or voice in _failed:
+        return None
+    if voice not in _rendering:
+        _rendering[voice] = asyncio.create_task(_render(voice))
+    return _rendering[voice]
+
+
+def _encode(audio: torch.Tensor, model_rate: int, sample_rate: Optional[int]) -> str:
+    if sample_rate and sample_rate < model_rate:
+        audio = resample(audio, model_rate, sample_rate)
+    else:
+        sample_rate = model_rate
+    return base64.b64encode(encode_wav_pcm16(audio, sample_rate)).decode("utf-8")
+
+
+async def pick(voice: str, sample_rate: Optional[int] = None) -> Optional[str]:
+    """
+    随机取一段已合成的填充语音，按实际输出采样率编码为 base64 WAV；
+    尚未合成时返回 None（不在回合中合成，避免与本回合的首句争用 TTS）
+    """
+    clips = _clips.get(voice)
+    if not clips:
+        return None
+    index = random.randrange(len(clips))
+    key = (voice, sample_rate, index)
+    encoded = _encoded.get(key)
+    if encoded is None:
+        audio, model_rate = clips[index]
+        encoded = await asyncio.to_thread(_encode, audio, model_rate, sample_rate)
+        _encoded[key] = encoded
+        while len(_encoded) > _MAX_ENCODED:
+            _encoded.popitem(last=False)
+    else:
+        _encoded.move_to_end(key)
+    return encoded
+
+
+def should_fill(predicted_ttfa_s: float) -> bool:
+    return bool(FILLER_TEXTS) and FILLER_THRESHOLD_MS > 0 and predicted_ttfa_s * 1000 > FILLER_THRESHOLD_MS
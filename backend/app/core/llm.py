@@ -1,11 +1,21 @@
 import os
-from typing import List, Dict, Union
-from openai import AsyncOpenAI
+import re
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import List, Dict, Optional, Union
+import httpx
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI
 from dotenv import load_dotenv
+from app.core import admission
 
 # 加载 .env 环境变量
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # 从环境变量读取配置，提供默认值
 BASE_URL = os.getenv("LLM_BASE_URL", "http://localhost:11434/v1")  # Ollama默认地址
 API_KEY = os.getenv("LLM_API_KEY", "ollama")  # Ollama不需要真实API密钥
@@ -13,16 +23,297 @@ MODEL = os.getenv("LLM_MODEL", "qwen2.5:7b")  # 默认模型
 
 # 验证关键配置
 if not BASE_URL:
-    print("⚠️ WARNING: LLM_BASE_URL not set, using default Ollama endpoint")
+    logger.warning("LLM_BASE_URL not set, using default Ollama endpoint")
     BASE_URL = "http://localhost:11434/v1"
 
-# 初始化异步客户端
-client = AsyncOpenAI(
-    api_key=API_KEY,
-    base_url=BASE_URL,
-)
+# 多个后端端点（逗号分隔，未设置时使用 LLM_BASE_URL），请求路由到首 token 延迟最低的健康端点
+LLM_ENDPOINTS = [u.strip() for u in os.getenv("LLM_ENDPOINTS", "").split(",") if u.strip()] or [BASE_URL]
+# 连接池与超时
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "16"))
+LLM_KEEPALIVE_S = float(os.getenv("LLM_KEEPALIVE_S", "60"))
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "3"))
+LLM_READ_TIMEOUT_S = float(os.getenv("LLM_READ_TIMEOUT_S", "60"))
+# 首 token 超时：超时后向另一个端点发起对冲请求，先返回首 token 的一方胜出，0 为不对冲
+LLM_FIRST_TOKEN_TIMEOUT_S = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT_S", "5"))
+# 健康检查间隔（秒），0 为关闭
+LLM_HEALTH_INTERVAL_S = float(os.getenv("LLM_HEALTH_INTERVAL_S", "30"))
+
+
+class Endpoint:
+    """一个 LLM 后端：独立的连接池与客户端，记录首 token 延迟与健康状态"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.client = AsyncOpenAI(
+            api_key=API_KEY,
+            base_url=base_url,
+            max_retries=0,  # 失败由端点切换处理
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                    keepalive_expiry=LLM_KEEPALIVE_S,
+                ),
+                timeout=httpx.Timeout(LLM_READ_TIMEOUT_S, connect=LLM_CONNECT_TIMEOUT_S),
+            ),
+        )
+        self.ttft = admission.Ewma()
+        self.healthy = True
+        self.active = 0
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0  # 首 token 超时而触发对冲的次数
+        self.last_error: Optional[str] = None
+
+    def score(self) -> float:
+        """
+        路由评分（越小越优）：首 token 延迟按进行中的请求数放大；尚无样本的端点优先试探。
+        超过超时阈值仍未出首 token、在对冲中落败的请求以已等待的时长记入样本，不会一直被当作无样本
+        """
+        return self.ttft.value * (1 + self.active)
+
+    def mark_failed(self, error: Exception):
+        self.failures += 1
+        self.healthy = False
+        self.last_error = str(error)
+        logger.warning("LLM endpoint failed: %s", error, extra={"endpoint": self.base_url})
+
+    def snapshot(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "ttft_ms": round(self.ttft.value * 1000),
+            "active": self.active,
+            "requests": self.requests,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "last_error": self.last_error,
+        }
+
+
+endpoints = [Endpoint(url) for url in LLM_ENDPOINTS]
+
+
+def _is_endpoint_error(error: BaseException) -> bool:
+    """
+    是否是端点自身的故障（连接失败、超时、5xx），只有这类错误才摘除端点并切换；
+    4xx 等请求本身的错误在任何端点上都会失败，直接抛出
+    """
+    if isinstance(error, (APIConnectionError, httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500
+    return False
+
+logger.info("LLM Client initialized: %s @ %s", MODEL, ", ".join(LLM_ENDPOINTS))
+
 
-print(f"[INFO] LLM Client initialized: {MODEL} @ {BASE_URL}")
+def _ranked_endpoints() -> List[Endpoint]:
+    """健康端点按评分排序在前；全部不健康时仍按评分尝试"""
+    return sorted(endpoints, key=lambda e: (not e.healthy, e.score()))
+
+
+async def _open_stream(endpoint: Endpoint, message_list: List[Dict[str, str]]):
+    """在指定端点发起流式请求并等待首个内容块，返回 (endpoint, response, iterator, first_content)"""
+    start = time.perf_counter()
+    endpoint.active += 1
+    endpoint.requests += 1
+    try:
+        response = await endpoint.client.chat.completions.create(
+            model=MODEL,
+            messages=message_list,
+            stream=True,
+            temperature=0.7,
+        )
+        iterator = response.__aiter__()
+        async for chunk in iterator:
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            if content:
+                endpoint.ttft.update(time.perf_counter() - start)
+                endpoint.healthy = True
+                return endpoint, response, iterator, content
+        return endpoint, response, iterator, ""
+    except asyncio.CancelledError:
+        endpoint.active -= 1
+        raise
+    except Exception as e:
+        endpoint.active -= 1
+        if _is_endpoint_error(e):
+            endpoint.mark_failed(e)
+        raise
+
+
+async def _discard(task: asyncio.Task):
+    """取消落败的请求；已拿到首 token 的关闭其响应流"""
+    task.cancel()
+    try:
+        endpoint, response, _, _ = await task
+    except BaseException:
+        return
+    endpoint.active -= 1
+    await response.close()
+
+
+async def _hedged_open(message_list: List[Dict[str, str]]):
+    """
+    在最优端点发起请求；失败时立即切换到下一个端点，
+    首 token 超过 LLM_FIRST_TOKEN_TIMEOUT_S 时向下一个端点发起对冲请求（只对冲一次），先到者胜
+    """
+    candidates = _ranked_endpoints()
+    # task -> (endpoint, 发起时间)，用于给落败的请求记入首 token 耗时
+    started: Dict[asyncio.Task, tuple] = {}
+
+    def start(endpoint: Endpoint) -> asyncio.Task:
+        task = asyncio.create_task(_open_stream(endpoint, message_list))
+        started[task] = (endpoint, time.perf_counter())
+        return task
+
+    pending = {start(candidates.pop(0))}
+    hedged = False
+    won = False
+    last_error: Optional[Exception] = None
+    try:
+        while pending:
+            timeout = None
+            if not hedged and candidates and LLM_FIRST_TOKEN_TIMEOUT_S > 0:
+                timeout = LLM_FIRST_TOKEN_TIMEOUT_S
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                for task in pending:
+                    slow = started[task][0]
+                    slow.hedges += 1
+                    logger.warning("LLM first token timeout, hedging to another endpoint", extra={"endpoint": slow.base_url})
+                pending.add(start(candidates.pop(0)))
+                continue
+            winner = None
+            client_error = None
+            for task in done:
+                if task.exception() is not None:
+                    last_error = task.exception()
+                    if not _is_endpoint_error(last_error):
+                        client_error = last_error
+                elif winner is None:
+                    winner = task.result()
+                else:
+                    await _discard(task)
+            if winner is not None:
+                won = True
+                return winner
+            if client_error is not None:
+                # 请求本身有误，换端点也会失败
+                raise client_error
+            if candidates:
+                pending.add(start(candidates.pop(0)))
+        raise last_error or RuntimeError("No LLM endpoint available")
+    finally:
+        for task in pending:
+            await _discard(task)
+            endpoint, started_at = started[task]
+            elapsed = time.perf_counter() - started_at
+            if won and task.cancelled() and elapsed >= LLM_FIRST_TOKEN_TIMEOUT_S:
+                # 超时后仍未出首 token 而落败：记入已等待的时长，否则无样本的端点会一直排在最前；
+                # 刚发起就被取消的对冲请求没有说明问题，不记样本
+                endpoint.ttft.update(elapsed)
+
+
+async def run_health_checks():
+    """后台任务：定期检查各端点（GET /models），恢复或摘除端点"""
+    if LLM_HEALTH_INTERVAL_S <= 0:
+        return
+    while True:
+        for endpoint in endpoints:
+            try:
+                await asyncio.wait_for(endpoint.client.models.list(), LLM_CONNECT_TIMEOUT_S + 2)
+                if not endpoint.healthy:
+                    logger.info("LLM endpoint recovered", extra={"endpoint": endpoint.base_url})
+                endpoint.healthy = True
+            except Exception as e:
+                # 返回 4xx（如不支持 /models）说明端点可达，不摘除
+                if endpoint.healthy and _is_endpoint_error(e):
+                    endpoint.mark_failed(e)
+        await asyncio.sleep(LLM_HEALTH_INTERVAL_S)
+
+
+def endpoint_stats() -> List[dict]:
+    return [endpoint.snapshot() for endpoint in endpoints]
+
+# 回复缓存（默认关闭）：相同问题在相同上下文下直接回放缓存的回复
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", "3600"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+# 参与缓存键的上文消息条数（不含 system 与本轮用户消息），默认包含上一轮问答；
+# 0 表示只缓存没有上文的回合（会话开场），"为什么？""继续"这类追问不会命中其他对话的回复
+LLM_CACHE_CONTEXT_MESSAGES = int(os.getenv("LLM_CACHE_CONTEXT_MESSAGES", "2"))
+# 回放速度（字/秒），模拟流式输出以保持下游断句与 TTS 节奏，0 表示不限速
+LLM_CACHE_REPLAY_CPS = float(os.getenv("LLM_CACHE_REPLAY_CPS", "200"))
+_REPLAY_CHUNK_CHARS = 4
+
+# 规范化只合并空白、忽略大小写与句末标点，不改动句中内容（"1+1" 与 "11" 不同）
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_TRAILING_PUNCTUATION_PATTERN = re.compile(r"[\s.,!?;:~…。，、！？；：～]+$")
+
+
+class ResponseCache:
+    """按 (规范化的本轮问题, system 提示与短上文的哈希) 缓存完整回复，带 TTL 与条数上限（LRU）"""
+
+    def __init__(self, ttl_s: float = LLM_CACHE_TTL_S, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.ttl = ttl_s
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(message_list: List[Dict[str, str]]) -> Optional[str]:
+        """缓存键；最后一条不是用户消息或规范化后为空时返回 None（不缓存）"""
+        if not message_list or message_list[-1].get("role") != "user":
+            return None
+        question = _WHITESPACE_PATTERN.sub(" ", message_list[-1].get("content", "")).strip().lower()
+        question = _TRAILING_PUNCTUATION_PATTERN.sub("", question)
+        if not question:
+            return None
+        system = [m.get("content", "") for m in message_list if m.get("role") == "system"]
+        history = [m for m in message_list[:-1] if m.get("role") != "system"]
+        if history and LLM_CACHE_CONTEXT_MESSAGES <= 0:
+            return None
+        context = history[-LLM_CACHE_CONTEXT_MESSAGES:] if LLM_CACHE_CONTEXT_MESSAGES > 0 else []
+        digest = hashlib.sha1(
+            "\x00".join(system + [f"{m.get('role')}:{m.get('content', '')}" for m in context] + [MODEL]).encode("utf-8")
+        ).hexdigest()[:16]
+        return f"{question}|{digest}"
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, reply: str):
+        self._entries[key] = (time.monotonic(), reply)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"enabled": LLM_CACHE_ENABLED, "entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+response_cache = ResponseCache()
+
+
+async def _replay(reply: str):
+    """把缓存的回复按 LLM_CACHE_REPLAY_CPS 的速度分块回放"""
+    for i in range(0, len(reply), _REPLAY_CHUNK_CHARS):
+        chunk = reply[i:i + _REPLAY_CHUNK_CHARS]
+        if LLM_CACHE_REPLAY_CPS > 0:
+            await asyncio.sleep(len(chunk) / LLM_CACHE_REPLAY_CPS)
+        yield chunk
 
 async def chat_stream(messages: Union[str, List[Dict[str, str]]]):
     """
@@ -30,7 +321,9 @@ async def chat_stream(messages: Union[str, List[Dict[str, str]]]):
     支持两种输入格式：
     1. 字符串: 自动包装为 [system, user] 消息
     2. 消息列表: 直接使用，如果缺少system消息则自动添加
+    开启 LLM_CACHE_ENABLED 时，命中缓存的问题直接回放缓存的回复
     """
+    cache_key = None
     try:
         # 处理输入格式
         if isinstance(messages, str):
@@ -51,19 +344,43 @@ async def chat_stream(messages: Union[str, List[Dict[str, str]]]):
                     "content": "You are a helpful voice assistant. Please keep your replies concise, short, and conversational suitable for TTS."
                 })
 
-        response = await client.chat.completions.create(
-            model=MODEL,
-            messages=message_list,
-            stream=True,
-            temperature=0.7,
-        )
+        if LLM_CACHE_ENABLED:
+            cache_key = response_cache.key(message_list)
+            cached = response_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                logger.info("LLM cache hit", extra={"chars": len(cached)})
+                async for chunk in _replay(cached):
+                    yield chunk
+                return
 
-        # 逐块读取流
-        async for chunk in response:
-            content = chunk.choices[0].delta.content
-            if content:
-                yield content
+        start = time.perf_counter()
+        endpoint, response, iterator, first_content = await _hedged_open(message_list)
+        # 记录首 token 延迟（含对冲等待），供准入控制估算首段语音延迟
+        admission.llm_ttft.update(time.perf_counter() - start)
+        parts = []
+        try:
+            if first_content:
+                parts.append(first_content)
+                yield first_content
+
+            # 逐块读取流
+            async for chunk in iterator:
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if content:
+                    parts.append(content)
+                    yield content
+        except Exception as e:
+            if _is_endpoint_error(e):
+                endpoint.mark_failed(e)
+            raise
+        finally:
+            endpoint.active -= 1
+            await response.close()
+
+        # 只缓存完整且成功的回复
+        if cache_key and parts:
+            response_cache.put(cache_key, "".join(parts))
 
     except Exception as e:
-        print(f"[ERROR] LLM Error: {e}")
+        logger.error("LLM Error: %s", e)
         yield f" Error: {str(e)}"
\ No newline at end of file
@@ -0,0 +1,142 @@
+import os
+import sys
+import copy
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+from dotenv import load_dotenv
+
+# setup_logging 早于其他模块调用，需先加载 .env
+load_dotenv()
+
+# 日志级别与输出格式（json 便于采集解析，text 便于本地阅读）
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# 后台写出队列容量，写满时丢弃新日志而不是阻塞调用方
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# 高频事件（带 extra={"sample": True}）的保留比例
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+# 会话上下文，自动附加到本协程/线程内产生的每条日志
+client_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("client_id", default=None)
+turn_id_var: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("turn_id", default=None)
+
+# LogRecord 自带的属性，其余属性视为结构化字段
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sample"}
+
+_listener: Optional[QueueListener] = None
+
+
+def bind_context(client_id: Optional[str] = None, turn_id: Optional[int] = None):
+    """设置当前上下文的 client_id / turn_id（对 asyncio.to_thread 等复制上下文的线程同样生效）"""
+    if client_id is not None:
+        client_id_var.set(client_id)
+    if turn_id is not None:
+        turn_id_var.set(turn_id)
+
+
+class _ContextFilter(logging.Filter):
+    """在调用方线程中附加会话上下文，并对高频事件抽样"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "sample", False) and random.random() >= LOG_SAMPLE_RATE:
+            return False
+        record.client_id = client_id_var.get()
+        record.turn_id = turn_id_var.get()
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """队列满时直接丢弃，保证日志调用永远不会阻塞事件循环"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只合并消息参数并把异常渲染为文本，保留结构化字段交给后台线程格式化
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "client_id", None):
+            entry["client_id"] = record.client_id
+        if getattr(record, "turn_id", None) is not None:
+            entry["turn_id"] = record.turn_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED and key not in ("client_id", "turn_id"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s %(context)s%(message)s%(fields)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        context = ""
+        if getattr(record, "client_id", None):
+            context = f"[{record.client_id}"
+            if getattr(record, "turn_id", None) is not None:
+                context += f"#{record.turn_id}"
+            context += "] "
+        record.context = context
+        fields = {
+            k: v for k, v in vars(record).items()
+            if k not in _RESERVED and k not in ("client_id", "turn_id", "context", "fields")
+        }
+        record.fields = " " + " ".join(f"{k}={v}" for k, v in fields.items()) if fields else ""
+        return super().format(record)
+
+
+def setup_logging():
+    """
+    为 app.* 日志配置队列化的后台写出：调用方只做入队，
+    格式化与 stdout 写入在独立线程中完成。重复调用无副作用。
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = _NonBlockingQueueHandler(log_queue)
+    handler.addFilter(_ContextFilter())
+
+    logger = logging.getLogger("app")
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
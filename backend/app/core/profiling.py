@@ -0,0 +1,238 @@
+import os
+import logging
+import sys
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 剖析结果输出目录
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(Path(__file__).parent.parent.parent / "profiles")))
+# 采样间隔（毫秒）
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# 最多保留的剖析文件数，超出后删除最旧的
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+# 运行时开关，由管理接口修改
+settings = {
+    "enabled": os.getenv("PROFILE_ENABLED", "false").lower() == "true",
+    "sample_rate": float(os.getenv("PROFILE_SAMPLE_RATE", "0.05")),  # 被剖析的回合比例
+    "torch": os.getenv("PROFILE_TORCH", "false").lower() == "true",  # 是否对 TTS/ASR 推理启用 torch profiler
+}
+
+
+class _StackSampler(threading.Thread):
+    """
+    低开销的采样剖析器：定期抓取 owns_thread(thread_id) 为真的线程的 Python 调用栈，
+    按 collapsed stack 格式（flamegraph.pl / speedscope 可直接读取）计数
+    """
+
+    def __init__(self, interval: float, owns_thread: Callable[[int], bool]):
+        super().__init__(daemon=True, name="turn-profiler")
+        self.interval = interval
+        self.owns_thread = owns_thread
+        self.counts = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me or not self.owns_thread(thread_id):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class TurnProfile:
+    """
+    一次被采样回合的剖析状态。只采样属于本回合的调用栈，其他会话的并发工作不计入：
+    1. 事件循环线程：当前运行的 asyncio 任务属于本回合时才采样
+       （Python 3.12+ 按任务的 contextvars 判断，含回合内创建的子任务；更早版本只识别回合主任务）
+    2. 推理线程：正在 inference_profile() 内执行本回合 TTS/ASR 推理时才采样
+    """
+
+    def __init__(self, client_id: str, turn_id: int):
+        self.client_id = client_id
+        self.turn_id = turn_id
+        self.tag = f"{client_id}-{turn_id}-{time.strftime('%Y%m%d%H%M%S')}"
+        self.torch_enabled = settings["torch"]
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.root_task = asyncio.current_task()
+        self.sampler = _StackSampler(PROFILE_INTERVAL_MS / 1000.0, self.owns_thread)
+        # 正在执行本回合推理的工作线程 -> 嵌套层数
+        self._threads = Counter()
+        self._threads_lock = threading.Lock()
+        self._trace_lock = threading.Lock()
+        self._trace_count = 0
+
+    def owns_thread(self, thread_id: int) -> bool:
+        """该线程此刻是否在执行本回合的工作（由采样线程调用）"""
+        if thread_id == self.loop_thread:
+            task = asyncio.current_task(self.loop)
+            if task is None:
+                return False
+            if task is self.root_task:
+                return True
+            get_context = getattr(task, "get_context", None)
+            return get_context is not None and get_context().get(_current_profile) is self
+        return self._threads.get(thread_id, 0) > 0
+
+    @contextmanager
+    def worker_thread(self):
+        """把当前线程登记为本回合的推理线程"""
+        thread_id = threading.get_ident()
+        with self._threads_lock:
+            self._threads[thread_id] += 1
+        try:
+            yield
+        finally:
+            with self._threads_lock:
+                self._threads[thread_id] -= 1
+                if self._threads[thread_id] <= 0:
+                    del self._threads[thread_id]
+
+    def next_trace_path(self, stage: str) -> Path:
+        with self._trace_lock:
+            self._trace_count += 1
+            return PROFILE_DIR / f"{self.tag}-{stage}{self._trace_count}.trace.json"
+
+    def write_folded(self) -> Path:
+        path = PROFILE_DIR / f"{self.tag}.folded"
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.sampler.counts.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+_current_profile: contextvars.ContextVar[Optional[TurnProfile]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+
+def current_profile() -> Optional[TurnProfile]:
+    return _current_profile.get()
+
+
+@asynccontextmanager
+async def profile_turn(client_id: str, turn_id: int):
+    """
+    包裹一个对话回合：按 settings["sample_rate"] 抽样，
+    被抽中的回合运行采样剖析器，结束后写出 <client_id>-<turn_id>-<time>.folded
+    （只含本回合的调用栈，见 TurnProfile）
+    """
+    if not settings["enabled"] or random.random() >= settings["sample_rate"]:
+        yield None
+        return
+
+    profile = TurnProfile(client_id, turn_id)
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    token = _current_profile.set(profile)
+    profile.sampler.start()
+    start = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+        profile.sampler.stop()
+        path = await asyncio.to_thread(profile.write_folded)
+        await asyncio.to_thread(_prune_old_profiles)
+        logger.info("Turn profiled", extra={
+            "file": path.name,
+            "duration_s": round(time.perf_counter() - start, 3),
+            "samples": profile.sampler.samples,
+        })
+
+
+@contextmanager
+def _torch_trace(profile: TurnProfile, stage: str):
+    import torch
+    from torch.profiler import ProfilerActivity, profile as torch_profile, record_function
+
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+    with torch_profile(activities=activities) as prof:
+        with record_function(stage):
+            yield
+    prof.export_chrome_trace(str(profile.next_trace_path(stage)))
+
+
+@contextmanager
+def _profiled_inference(profile: TurnProfile, stage: str):
+    with profile.worker_thread():
+        if profile.torch_enabled:
+            with _torch_trace(profile, stage):
+                yield
+        else:
+            yield
+
+
+def inference_profile(stage: str):
+    """
+    在推理线程中包裹一次 TTS/ASR 推理：当前回合被抽中时把该线程计入调用栈采样，
+    开启了 torch 剖析时还记录 torch profiler trace（chrome://tracing / Perfetto 可查看）；
+    未被抽中时为空操作。
+    需要在复制了调用方 contextvars 的线程中调用（asyncio.to_thread 或 ctx.run）。
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        return nullcontext()
+    return _profiled_inference(profile, stage)
+
+
+def list_profiles(client_id: Optional[str] = None) -> List[dict]:
+    """列出已生成的剖析文件（新的在前）"""
+    if not PROFILE_DIR.exists():
+        return []
+    files = [
+        p for p in PROFILE_DIR.iterdir()
+        if p.is_file() and (client_id is None or p.name.startswith(f"{client_id}-"))
+    ]
+    files.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+    return [
+        {"name": p.name, "size": p.stat().st_size, "created": p.stat().st_mtime}
+        for p in files
+    ]
+
+
+def resolve_profile(name: str) -> Optional[Path]:
+    """按文件名查找剖析文件，拒绝目录穿越"""
+    if os.path.basename(name) != name or name.startswith("."):
+        return None
+    path = PROFILE_DIR / name
+    return path if path.is_file() else None
+
+
+def _prune_old_profiles():
+    files = sorted(
+        (p for p in PROFILE_DIR.iterdir() if p.is_file()),
+        key=lambda p: p.stat().st_mtime,
+    )
+    for p in files[:max(0, len(files) - PROFILE_MAX_FILES)]:
+        try:
+            p.unlink()
+        except OSError:
+            pass
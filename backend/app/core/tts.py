@@ -1,11 +1,16 @@
 import os
+import re
 import sys
+import json
+import logging
 import base64
-import io
 import asyncio
+import contextvars
 import torch
 import soundfile as sf
+from collections import OrderedDict
 from pathlib import Path
+from typing import Dict, Optional
 
 # Disable torchcodec before importing torchaudio
 # This forces torchaudio to use soundfile backend
@@ -13,6 +18,14 @@ os.environ.setdefault('TORCHAUDIO_USE_BACKEND_DISPATCHER', '0')
 
 import torchaudio
 
+from app.core.tts_cpu import apply_backend, optimize_for_cpu
+from app.core.audio import encode_wav_pcm16, resample
+from app.core.profiling import inference_profile
+from app.core.admission import Stage
+from app.core.tts_registry import ModelRegistry, checkpoint_bytes, mmap_weights
+
+logger = logging.getLogger(__name__)
+
 # Monkey-patch torchaudio.load to handle torchcodec errors
 _original_torchaudio_load = torchaudio.load
 
@@ -82,12 +95,11 @@ def patch_cosyvoice_load_wav():
                         # Resample if needed
                         if sample_rate != target_sr:
                             assert sample_rate >= min_sr, f'wav sample rate {sample_rate} must be greater than {min_sr}'
-                            resampler = torchaudio.transforms.Resample(orig_freq=sample_rate, new_freq=target_sr)
-                            speech = resampler(speech)
+                            speech = resample(speech, sample_rate, target_sr)
                         
                         return speech
                     except Exception as fallback_error:
-                        print(f"⚠️  Soundfile fallback also failed: {fallback_error}")
+                        logger.warning("Soundfile fallback also failed: %s", fallback_error)
                         raise e  # Re-raise original error
                 else:
                     raise
@@ -96,7 +108,7 @@ def patch_cosyvoice_load_wav():
         file_utils.load_wav = patched_load_wav
         return True
     except Exception as e:
-        print(f"⚠️  Could not patch load_wav: {e}")
+        logger.warning("Could not patch load_wav: %s", e)
         return False
 
 try:
@@ -104,210 +116,436 @@ try:
     # Patch after import
     patch_cosyvoice_load_wav()
 except ImportError as e:
-    print(f"⚠️  CosyVoice not available: {e}")
-    print("Please ensure CosyVoice is cloned and dependencies are installed.")
+    logger.warning("CosyVoice not available: %s. Please ensure CosyVoice is cloned and dependencies are installed.", e)
     AutoModel = None
 
 # Model configuration
 MODEL_DIR_ENV = os.getenv("COSYVOICE_MODEL_DIR", "pretrained_models/Fun-CosyVoice3-0.5B")
+
+
+def _resolve_path(path: str) -> str:
+    """Resolve a path relative to the backend directory"""
+    return path if os.path.isabs(path) else str(backend_path / path)
+
+
 # Resolve model directory relative to backend
-if not os.path.isabs(MODEL_DIR_ENV):
-    MODEL_DIR = str(backend_path / MODEL_DIR_ENV)
-else:
-    MODEL_DIR = MODEL_DIR_ENV
+MODEL_DIR = _resolve_path(MODEL_DIR_ENV)
 SPEAKER_ID = os.getenv("COSYVOICE_SPEAKER_ID", "中文女")  # Default speaker for SFT model
 USE_SFT = os.getenv("COSYVOICE_USE_SFT", "false").lower() == "true"
-# 实际使用的模式（SFT可能回退到zero-shot）
-_SFT_AVAILABLE = False
+# Optional JSON file defining additional voices, see Voice
+TTS_VOICES_FILE = os.getenv("TTS_VOICES_FILE", "")
 
 # Check if model directory exists
 if not os.path.exists(MODEL_DIR):
-    print(f"⚠️ WARNING: CosyVoice model directory not found: {MODEL_DIR}")
-    print("   Please download the model or set COSYVOICE_MODEL_DIR environment variable.")
+    logger.warning("CosyVoice model directory not found: %s. Please download the model or set COSYVOICE_MODEL_DIR environment variable.", MODEL_DIR)
     # Try alternative paths
     alternative_path = str(backend_path / "CosyVoice" / "pretrained_models")
     if os.path.exists(alternative_path):
-        print(f"   Trying alternative path: {alternative_path}")
+        logger.info("Trying alternative path: %s", alternative_path)
         MODEL_DIR = alternative_path
     else:
-        print("   No alternative paths found. TTS will not work until model is downloaded.")
-
-# Global model instance
-_model = None
-_model_lock = asyncio.Lock()
-_SFT_SPEAKER_ID = SPEAKER_ID  # 默认使用环境变量配置的说话人
-
-def _load_model():
-    """Load CosyVoice model (synchronous)"""
-    global _model, _SFT_AVAILABLE, _SFT_SPEAKER_ID
-    if _model is None:
-        if AutoModel is None:
-            raise ImportError("CosyVoice AutoModel is not available. Please install CosyVoice dependencies.")
-        print(f"🔄 Loading CosyVoice model from {MODEL_DIR}...")
+        logger.warning("No alternative paths found. TTS will not work until model is downloaded.")
+
+# Zero-shot prompt (CosyVoice3 recommended)
+# Using optimized shorter prompt for better performance
+PROMPT_TEXT = "你好。"  # 更短的提示文本
+PROMPT_WAV = str(cosyvoice_path / "asset" / "zero_shot_prompt.wav")
+
+# Speaker embeddings shipped with SFT models; their presence decides the
+# inference mode before anything is loaded
+SFT_SPEAKER_FILE = "spk2info.pt"
+
+
+class Voice:
+    """
+    A voice a session can select: a model directory plus either an SFT
+    speaker or a zero-shot prompt. Voices sharing a model directory share the
+    loaded model.
+    """
+
+    def __init__(self, name: str, model_dir: str, speaker: Optional[str] = None,
+                 prompt_text: str = PROMPT_TEXT, prompt_wav: str = PROMPT_WAV):
+        self.name = name
+        self.model_dir = model_dir
+        self.speaker = speaker
+        self.prompt_text = prompt_text
+        self.prompt_wav = prompt_wav
+        # SFT inference needs a speaker and a model that ships speaker embeddings
+        self.sft = bool(speaker) and os.path.exists(os.path.join(model_dir, SFT_SPEAKER_FILE))
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "model_dir": os.path.basename(self.model_dir),
+            "mode": "sft" if self.sft else "zero_shot",
+        }
+
+
+def _default_voice() -> Voice:
+    """Voice configured by COSYVOICE_MODEL_DIR / COSYVOICE_USE_SFT / COSYVOICE_SPEAKER_ID"""
+    if USE_SFT:
+        # Try SFT model first (faster if available)
+        sft_dir = MODEL_DIR if "SFT" in MODEL_DIR else MODEL_DIR.replace("Fun-CosyVoice3-0.5B", "CosyVoice-300M-SFT")
+        voice = Voice("default", sft_dir, speaker=SPEAKER_ID)
+        if voice.sft:
+            return voice
+        logger.warning("No SFT speakers found in %s, using zero-shot mode with %s", sft_dir, MODEL_DIR)
+    # Use zero-shot inference (CosyVoice3 recommended)
+    return Voice("default", MODEL_DIR)
+
+
+def _load_voices() -> Dict[str, Voice]:
+    """
+    Build the voice table. TTS_VOICES_FILE maps names to definitions:
+
+        {"narrator": {"model_dir": "pretrained_models/CosyVoice-300M-SFT", "speaker": "中文男"},
+         "cloned":   {"model_dir": "pretrained_models/Fun-CosyVoice3-0.5B",
+                      "prompt_wav": "voices/alice.wav", "prompt_text": "你好，我是爱丽丝。"}}
+    """
+    voices = {"default": _default_voice()}
+    if not TTS_VOICES_FILE:
+        return voices
+    try:
+        with open(_resolve_path(TTS_VOICES_FILE), encoding="utf-8") as f:
+            definitions = json.load(f)
+        for name, definition in definitions.items():
+            voices[name] = Voice(
+                name,
+                _resolve_path(definition.get("model_dir", MODEL_DIR)),
+                speaker=definition.get("speaker"),
+                prompt_text=definition.get("prompt_text", PROMPT_TEXT),
+                prompt_wav=_resolve_path(definition["prompt_wav"]) if "prompt_wav" in definition else PROMPT_WAV,
+            )
+    except Exception as e:
+        logger.error("Failed to load TTS voices from %s: %s", TTS_VOICES_FILE, e)
+    return voices
+
+
+VOICES = _load_voices()
+DEFAULT_VOICE = "default"
+logger.info("TTS voices: %s", ", ".join(f"{v.name} ({v.describe()['mode']})" for v in VOICES.values()))
+
+# Number of in-process replicas per loaded model; syntheses on different
+# replicas run in parallel (torch releases the GIL during inference)
+TTS_REPLICAS = max(1, int(os.getenv("TTS_REPLICAS", "1")))
+# Concurrent syntheses across replicas; queueing beyond this is tracked by the
+# admission controller (see admission.py)
+TTS_CONCURRENCY = max(1, int(os.getenv("TTS_CONCURRENCY", str(TTS_REPLICAS))))
+tts_stage = Stage("tts", TTS_CONCURRENCY)
+
+# CPU backend validated per model directory, reused when a model is reloaded
+_cpu_backends: Dict[str, str] = {}
+# Native output rate per model directory, read from the model config or
+# recorded when the model loads; kept across unloads
+_native_rates: Dict[str, Optional[int]] = {}
+
+
+def _probe_voice(model_dir: str) -> Voice:
+    """A voice on model_dir used for the CPU backend probe"""
+    for voice in VOICES.values():
+        if voice.model_dir == model_dir:
+            return voice
+    return Voice("probe", model_dir)
+
+
+def _load_model_dir(model_dir: str):
+    """Load TTS_REPLICAS copies of a CosyVoice model (synchronous), returns (replicas, info)"""
+    if AutoModel is None:
+        raise ImportError("CosyVoice AutoModel is not available. Please install CosyVoice dependencies.")
+    logger.info("Loading CosyVoice model from %s...", model_dir)
+    with mmap_weights():
+        model = AutoModel(model_dir=model_dir)
+    speakers = model.list_available_spks()
+    _native_rates[model_dir] = model.sample_rate
+
+    # Select the CPU inference backend once per model (no-op on CUDA)
+    if model_dir not in _cpu_backends:
+        voice = _probe_voice(model_dir)
+        _cpu_backends[model_dir] = optimize_for_cpu(model, model_dir, lambda m, t: _synthesize(m, t, voice))
+    elif not apply_backend(model, model_dir, _cpu_backends[model_dir]):
+        _cpu_backends[model_dir] = "eager"
+    backend = _cpu_backends[model_dir]
+
+    replicas = [model]
+    for index in range(1, TTS_REPLICAS):
         try:
-            if USE_SFT:
-                # Try SFT model first (faster if available)
-                try:
-                    model_path = MODEL_DIR if "SFT" in MODEL_DIR else MODEL_DIR.replace("Fun-CosyVoice3-0.5B", "CosyVoice-300M-SFT")
-                    _model = AutoModel(model_dir=model_path)
-
-                    # 检查是否有可用的说话人
-                    available_speakers = _model.list_available_spks()
-                    print(f"✅ CosyVoice SFT model loaded. Available speakers: {available_speakers}")
-
-                    if available_speakers:
-                        _SFT_AVAILABLE = True
-                        # 选择有效的说话人ID
-                        if SPEAKER_ID in available_speakers:
-                            _SFT_SPEAKER_ID = SPEAKER_ID
-                        else:
-                            _SFT_SPEAKER_ID = available_speakers[0]
-                            print(f"⚠️ Speaker ID '{SPEAKER_ID}' not in available speakers. Using '{_SFT_SPEAKER_ID}' instead.")
-                        print(f"✅ Using speaker ID: {_SFT_SPEAKER_ID}")
-                    else:
-                        print(f"⚠️ SFT model loaded but no speakers available. This may be a zero-shot model. Falling back to zero-shot mode.")
-                        # 重新加载为零样本模型
-                        _model = AutoModel(model_dir=MODEL_DIR)
-                        _SFT_AVAILABLE = False
-                        print(f"✅ CosyVoice zero-shot model loaded (fallback).")
-                except Exception as sft_error:
-                    print(f"⚠️ SFT model loading failed: {sft_error}, falling back to zero-shot mode")
-                    # Fallback to zero-shot
-                    _model = AutoModel(model_dir=MODEL_DIR)
-                    _SFT_AVAILABLE = False
-                    print(f"✅ CosyVoice zero-shot model loaded (fallback).")
-            else:
-                # Use zero-shot inference (CosyVoice3 recommended)
-                _model = AutoModel(model_dir=MODEL_DIR)
-                _SFT_AVAILABLE = False
-                print(f"✅ CosyVoice model loaded.")
+            with mmap_weights():
+                replica = AutoModel(model_dir=model_dir)
+            if not apply_backend(replica, model_dir, backend):
+                logger.warning("TTS replica runs eager, %s backend could not be applied", backend)
+            replicas.append(replica)
         except Exception as e:
-            print(f"❌ Failed to load CosyVoice model: {e}")
+            logger.error("Failed to load TTS replica %d: %s", index, e)
+            break
+    return replicas, {"cpu_backend": backend, "speakers": speakers}
+
+
+def _estimate_model_dir(model_dir: str) -> int:
+    return checkpoint_bytes(model_dir) * TTS_REPLICAS
+
+
+registry = ModelRegistry(_load_model_dir, _estimate_model_dir)
+
+
+def resolve_voice(name: Optional[str]) -> str:
+    """Validate a voice name requested by a client, raises ValueError if unknown"""
+    if name is None:
+        return DEFAULT_VOICE
+    if name not in VOICES:
+        raise ValueError(f"Unknown voice '{name}', available: {', '.join(VOICES)}")
+    return name
+
+
+def _read_native_rate(model_dir: str) -> Optional[int]:
+    """Top-level sample_rate from the model's yaml config, without loading the model"""
+    for path in sorted(Path(model_dir).glob("*.yaml")):
+        try:
+            match = re.search(r"^sample_rate:\s*(\d+)", path.read_text(encoding="utf-8"), re.MULTILINE)
+        except OSError:
+            continue
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def native_sample_rate(voice: str = DEFAULT_VOICE) -> Optional[int]:
+    """Output rate of the voice's model, or None if it cannot be determined yet"""
+    model_dir = VOICES[voice or DEFAULT_VOICE].model_dir
+    if model_dir not in _native_rates:
+        _native_rates[model_dir] = _read_native_rate(model_dir)
+    return _native_rates[model_dir]
+
+
+def effective_sample_rate(sample_rate: Optional[int], voice: str = DEFAULT_VOICE) -> Optional[int]:
+    """
+    Rate text_to_wav actually outputs for a requested rate: lower rates are
+    downsampled, higher ones fall back to the model rate (never upsampled).
+    None requests the model rate; returns None only while that is unknown.
+    """
+    native = native_sample_rate(voice)
+    if sample_rate is None or (native is not None and sample_rate >= native):
+        return native
+    return sample_rate
+
+
+def list_voices():
+    return [
+        {**voice.describe(), "loaded": registry.get(voice.model_dir) is not None}
+        for voice in VOICES.values()
+    ]
+
+
+async def preload():
+    """Load the default voice ahead of the first request (also runs CPU backend selection)"""
+    try:
+        entry = await registry.acquire(VOICES[DEFAULT_VOICE].model_dir, pinned=True)
+        registry.release(entry)
+    except Exception as e:
+        logger.warning("TTS preload failed: %s", e)
+
+
+def _synthesize_sft(model, text: str, speaker_id: str):
+    """Synchronous SFT inference (faster, requires speaker ID)"""
+    audio_chunks = []
+    try:
+        for result in model.inference_sft(text, speaker_id, stream=False):
+            audio_chunks.append(result['tts_speech'])
+    except KeyError as e:
+        logger.error("SFT synthesis failed with speaker ID '%s': %s", speaker_id, e)
+        # 尝试使用第一个可用的说话人（如果不同）
+        available_speakers = model.list_available_spks()
+        if available_speakers and speaker_id != available_speakers[0]:
+            logger.warning("Trying alternative speaker: %s", available_speakers[0])
+            audio_chunks = []
+            for result in model.inference_sft(text, available_speakers[0], stream=False):
+                audio_chunks.append(result['tts_speech'])
+        else:
             raise
-    return _model
-
-async def _get_model():
-    """Get or load model (async-safe)"""
-    async with _model_lock:
-        if _model is None:
-            # Run model loading in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, _load_model)
-        return _model
-
-async def text_to_speech(text: str) -> str:
+
+    if audio_chunks:
+        # Concatenate all chunks
+        audio = torch.cat(audio_chunks, dim=1)
+        return audio, model.sample_rate
+    return None, None
+
+def _synthesize_zero_shot(model, text: str, prompt_text: str = PROMPT_TEXT, prompt_wav: str = PROMPT_WAV):
+    """Synchronous zero-shot inference (needs a prompt text and prompt audio)"""
+    audio_chunks = []
+    # CosyVoice3 requires <|endofprompt|> token
+    full_prompt = f"You are an assistant.<|endofprompt|>{prompt_text}"  # 更短的系统提示
+
+    if os.path.exists(prompt_wav):
+        for result in model.inference_zero_shot(
+            text,
+            full_prompt,
+            prompt_wav,
+            stream=False
+        ):
+            audio_chunks.append(result['tts_speech'])
+    else:
+        # Fallback: try without prompt audio (may not work for all models)
+        try:
+            for result in model.inference_zero_shot(
+                text,
+                full_prompt,
+                "",
+                stream=False
+            ):
+                audio_chunks.append(result['tts_speech'])
+        except:
+            # Last resort: try SFT if available
+            if hasattr(model, 'inference_sft'):
+                speakers = model.list_available_spks()
+                speaker = speakers[0] if speakers else "中文女"
+                for result in model.inference_sft(text, speaker, stream=False):
+                    audio_chunks.append(result['tts_speech'])
+
+    if audio_chunks:
+        audio = torch.cat(audio_chunks, dim=1)
+        return audio, model.sample_rate
+    return None, None
+
+def _synthesize(model, text: str, voice: Voice):
+    """Run one synthesis on the given model (synchronous), returns (audio, sample_rate)"""
+    if voice.sft:
+        return _synthesize_sft(model, text, voice.speaker)
+    return _synthesize_zero_shot(model, text, voice.prompt_text, voice.prompt_wav)
+
+async def synthesize(text: str, voice: str = DEFAULT_VOICE, offline: bool = False):
     """
-    Convert text to speech using CosyVoice.
+    Synthesize text into a waveform. Offline callers (batch synthesis) only
+    take a TTS slot when no live request is waiting, see Stage.slot().
+
+    Returns:
+        (audio tensor [1, samples], sample_rate), or (None, None) if nothing was generated
+    """
+    selected = VOICES.get(voice or DEFAULT_VOICE, VOICES[DEFAULT_VOICE])
+    entry = await registry.acquire(selected.model_dir, pinned=selected.name == DEFAULT_VOICE)
+
+    def _run(model):
+        with inference_profile("tts"):
+            return _synthesize(model, text, selected)
+
+    # Run inference in thread pool to avoid blocking; the copied context lets
+    # profiling hooks see the current turn inside the worker thread
+    loop = asyncio.get_event_loop()
+    try:
+        async with tts_stage.slot(offline=offline):
+            model = await entry.replicas.get()
+            try:
+                return await loop.run_in_executor(None, contextvars.copy_context().run, _run, model)
+            finally:
+                entry.replicas.put_nowait(model)
+    finally:
+        registry.release(entry)
+
+# Rendered-audio cache for repeated sentences (e.g. replies replayed from the
+# LLM response cache); 0 disables it
+TTS_CACHE_MB = float(os.getenv("TTS_CACHE_MB", "0"))
+
+
+class WavCache:
+    """LRU cache of (voice, sample_rate, text) -> (WAV bytes, duration), bounded by total bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, wav_bytes: bytes, duration: float):
+        if not self.max_bytes or len(wav_bytes) > self.max_bytes or key in self._entries:
+            return
+        self._entries[key] = (wav_bytes, duration)
+        self.size += len(wav_bytes)
+        while self.size > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": bool(self.max_bytes),
+            "entries": len(self._entries),
+            "size_mb": round(self.size / 1024 / 1024, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+wav_cache = WavCache(int(TTS_CACHE_MB * 1024 * 1024))
+
+async def text_to_wav(text: str, sample_rate: int = None, voice: str = DEFAULT_VOICE, offline: bool = False):
+    """
+    Convert text to WAV bytes using CosyVoice.
     
     Args:
         text: Text to synthesize
+        sample_rate: Output sample rate; audio is downsampled when lower than
+            the model rate (never upsampled). None keeps the model rate.
+        voice: Voice name, see VOICES
+        offline: Queue behind live requests, see synthesize()
         
     Returns:
-        Base64-encoded WAV audio data, or empty string on error
+        (16-bit PCM WAV bytes, duration in seconds), or (b"", 0.0) on error
     """
     if not text or not text.strip():
-        return ""
+        return b"", 0.0
+
+    sample_rate = effective_sample_rate(sample_rate, voice)
+    cache_key = (voice or DEFAULT_VOICE, sample_rate, text.strip())
+    if wav_cache.max_bytes:
+        cached = wav_cache.get(cache_key)
+        if cached is not None:
+            return cached
     
     try:
-        model = await _get_model()
-        
-        # Run inference in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        
-        if _SFT_AVAILABLE:
-            # Use SFT inference (faster, requires speaker ID)
-            def _synthesize_sft():
-                audio_chunks = []
-                # 使用全局的_SFT_SPEAKER_ID
-                speaker_id = _SFT_SPEAKER_ID if _SFT_SPEAKER_ID else "default"
-                try:
-                    for result in model.inference_sft(text, speaker_id, stream=False):
-                        audio_chunks.append(result['tts_speech'])
-                except KeyError as e:
-                    print(f"❌ SFT synthesis failed with speaker ID '{speaker_id}': {e}")
-                    # 尝试使用第一个可用的说话人（如果不同）
-                    available_speakers = model.list_available_spks()
-                    if available_speakers and speaker_id != available_speakers[0]:
-                        print(f"⚠️ Trying alternative speaker: {available_speakers[0]}")
-                        audio_chunks = []
-                        for result in model.inference_sft(text, available_speakers[0], stream=False):
-                            audio_chunks.append(result['tts_speech'])
-                    else:
-                        raise
-
-                if audio_chunks:
-                    # Concatenate all chunks
-                    audio = torch.cat(audio_chunks, dim=1)
-                    return audio, model.sample_rate
-                return None, None
-
-            audio, sample_rate = await loop.run_in_executor(None, _synthesize_sft)
-        else:
-            # Use zero-shot inference (CosyVoice3 recommended)
-            # For zero-shot, we need a prompt text and prompt audio
-            # Using optimized shorter prompt for better performance
-            prompt_text = "你好。"  # 更短的提示文本
-            prompt_wav = str(cosyvoice_path / "asset" / "zero_shot_prompt.wav")
-            
-            # Fallback if prompt file doesn't exist
-            if not os.path.exists(prompt_wav):
-                prompt_wav = None
-            
-            def _synthesize_zero_shot():
-                audio_chunks = []
-                # CosyVoice3 requires <|endofprompt|> token
-                full_prompt = f"You are an assistant.<|endofprompt|>{prompt_text}"  # 更短的系统提示
-                
-                if prompt_wav and os.path.exists(prompt_wav):
-                    for result in model.inference_zero_shot(
-                        text, 
-                        full_prompt, 
-                        prompt_wav, 
-                        stream=False
-                    ):
-                        audio_chunks.append(result['tts_speech'])
-                else:
-                    # Fallback: try without prompt audio (may not work for all models)
-                    try:
-                        for result in model.inference_zero_shot(
-                            text,
-                            full_prompt,
-                            "",
-                            stream=False
-                        ):
-                            audio_chunks.append(result['tts_speech'])
-                    except:
-                        # Last resort: try SFT if available
-                        if hasattr(model, 'inference_sft'):
-                            speakers = model.list_available_spks()
-                            speaker = speakers[0] if speakers else "中文女"
-                            for result in model.inference_sft(text, speaker, stream=False):
-                                audio_chunks.append(result['tts_speech'])
-                
-                if audio_chunks:
-                    audio = torch.cat(audio_chunks, dim=1)
-                    return audio, model.sample_rate
-                return None, None
-            
-            audio, sample_rate = await loop.run_in_executor(None, _synthesize_zero_shot)
+        audio, model_rate = await synthesize(text, voice, offline)
         
         if audio is None:
-            print("❌ TTS: No audio generated")
-            return ""
+            logger.error("TTS: No audio generated")
+            return b"", 0.0
         
-        # Convert to WAV bytes
-        buffer = io.BytesIO()
-        torchaudio.save(buffer, audio, sample_rate, format="wav")
-        buffer.seek(0)
-        wav_bytes = buffer.read()
+        if sample_rate and sample_rate < model_rate:
+            audio = resample(audio, model_rate, sample_rate)
+        else:
+            sample_rate = model_rate
         
-        # Encode to base64
-        audio_base64 = base64.b64encode(wav_bytes).decode('utf-8')
-        return audio_base64
+        # Encode straight into a preallocated 16-bit PCM WAV buffer
+        wav_bytes = encode_wav_pcm16(audio, sample_rate)
+        duration = audio.shape[-1] / sample_rate
+        wav_cache.put(cache_key, wav_bytes, duration)
+        return wav_bytes, duration
         
     except Exception as e:
-        print(f"❌ TTS Error: {e}")
-        import traceback
-        traceback.print_exc()
-        return ""
+        logger.exception("TTS Error: %s", e)
+        return b"", 0.0
 
+async def text_to_speech(text: str, sample_rate: int = None, voice: str = DEFAULT_VOICE) -> str:
+    """
+    Convert text to speech using CosyVoice.
+    
+    Args:
+        text: Text to synthesize
+        sample_rate: Output sample rate, see text_to_wav
+        voice: Voice name, see VOICES
+        
+    Returns:
+        Base64-encoded WAV audio data, or empty string on error
+    """
+    wav_bytes, _ = await text_to_wav(text, sample_rate, voice)
+    if not wav_bytes:
+        return ""
+    
+    # Encode to base64
+    audio_base64 = base64.b64encode(wav_bytes).decode('utf-8')
+    return audio_base64
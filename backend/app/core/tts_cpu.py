@@ -0,0 +1,245 @@
+"""
+CPU inference backends for CosyVoice.
+
+Without a GPU, AutoModel runs fp32 eager PyTorch. TTS_CPU_BACKEND selects an
+optimized backend that is applied right after the model is loaded:
+
+    eager    default PyTorch (no change)
+    int8     dynamic int8 quantization of the Linear layers in the LLM and flow
+    compile  torch.compile on the flow-matching estimator (the per-step hot loop)
+    onnx     ONNX Runtime for the flow-matching estimator, using the
+             flow.decoder.estimator.fp32.onnx exported by CosyVoice's
+             cosyvoice/bin/export_onnx.py
+
+The optimized model is checked against the eager output on a probe sentence;
+if parity fails the eager modules are restored. Real-time factor (RTF) of both
+is reported.
+"""
+import os
+import time
+import logging
+import torch
+
+logger = logging.getLogger(__name__)
+
+TTS_CPU_BACKEND = os.getenv("TTS_CPU_BACKEND", "eager").lower()
+TTS_CPU_THREADS = int(os.getenv("TTS_CPU_THREADS", "0"))  # 0 = torch default
+TTS_CPU_PARITY_CHECK = os.getenv("TTS_CPU_PARITY_CHECK", "true").lower() == "true"
+
+PROBE_TEXT = "你好，很高兴为你服务。"
+# Stochastic token sampling means waveforms never match sample-for-sample, so
+# parity is judged on duration and average spectrum.
+PARITY_MAX_DURATION_DIFF = 0.3
+PARITY_MIN_SPECTRAL_SIMILARITY = 0.9
+
+ONNX_ESTIMATOR_FILE = "flow.decoder.estimator.fp32.onnx"
+
+
+class _OnnxEstimator(torch.nn.Module):
+    """Drop-in replacement for the flow-matching estimator backed by ONNX Runtime"""
+
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+        self.input_names = [i.name for i in session.get_inputs()]
+
+    def forward(self, x, mask, mu, t, spks, cond, **kwargs):
+        feeds = {
+            name: tensor.detach().float().cpu().numpy()
+            for name, tensor in zip(self.input_names, (x, mask, mu, t, spks, cond))
+        }
+        output = self.session.run(None, feeds)[0]
+        return torch.from_numpy(output).to(x.device)
+
+
+def _apply_int8(model):
+    inner = model.model
+    originals = {}
+    for name in ("llm", "flow"):
+        module = getattr(inner, name, None)
+        if module is None:
+            continue
+        originals[name] = module
+        setattr(inner, name, torch.ao.quantization.quantize_dynamic(
+            module, {torch.nn.Linear}, dtype=torch.qint8
+        ))
+    if not originals:
+        return None
+
+    def restore():
+        for name, module in originals.items():
+            setattr(inner, name, module)
+    return restore
+
+
+def _get_estimator_owner(model):
+    decoder = getattr(getattr(model.model, "flow", None), "decoder", None)
+    if decoder is None or not isinstance(getattr(decoder, "estimator", None), torch.nn.Module):
+        return None
+    return decoder
+
+
+def _apply_compile(model):
+    if not hasattr(torch, "compile"):
+        logger.warning("torch.compile requires PyTorch 2.x")
+        return None
+    decoder = _get_estimator_owner(model)
+    if decoder is None:
+        logger.warning("Flow estimator not found, torch.compile skipped")
+        return None
+    original = decoder.estimator
+    decoder.estimator = torch.compile(original, dynamic=True)
+
+    def restore():
+        decoder.estimator = original
+    return restore
+
+
+def _apply_onnx(model, model_dir: str):
+    try:
+        import onnxruntime
+    except ImportError:
+        logger.warning("onnxruntime not installed, ONNX backend skipped")
+        return None
+    decoder = _get_estimator_owner(model)
+    if decoder is None:
+        logger.warning("Flow estimator not found, ONNX backend skipped")
+        return None
+    onnx_path = os.path.join(model_dir, ONNX_ESTIMATOR_FILE)
+    if not os.path.exists(onnx_path):
+        logger.warning("%s not found. Export it with: python CosyVoice/cosyvoice/bin/export_onnx.py --model_dir %s",
+                       onnx_path, model_dir)
+        return None
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if TTS_CPU_THREADS:
+        options.intra_op_num_threads = TTS_CPU_THREADS
+    session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+    original = decoder.estimator
+    decoder.estimator = _OnnxEstimator(session)
+
+    def restore():
+        decoder.estimator = original
+    return restore
+
+
+def _measure(synthesize, model):
+    """Synthesize the probe sentence with a fixed seed, returns (audio, rtf)"""
+    torch.manual_seed(0)
+    start = time.perf_counter()
+    audio, sample_rate = synthesize(model, PROBE_TEXT)
+    elapsed = time.perf_counter() - start
+    if audio is None:
+        return None, None
+    return audio, elapsed / (audio.shape[-1] / sample_rate)
+
+
+def _average_spectrum(audio):
+    n_fft = 1024
+    spec = torch.stft(
+        audio.flatten().float(), n_fft=n_fft, hop_length=n_fft // 4,
+        window=torch.hann_window(n_fft), return_complex=True,
+    )
+    return torch.log1p(spec.abs()).mean(dim=1)
+
+
+def _check_parity(reference, candidate):
+    """Compare candidate audio against the eager reference, returns (ok, details)"""
+    if candidate is None:
+        return False, "no audio generated"
+    duration_diff = abs(candidate.shape[-1] - reference.shape[-1]) / reference.shape[-1]
+    similarity = torch.nn.functional.cosine_similarity(
+        _average_spectrum(reference), _average_spectrum(candidate), dim=0
+    ).item()
+    ok = duration_diff <= PARITY_MAX_DURATION_DIFF and similarity >= PARITY_MIN_SPECTRAL_SIMILARITY
+    return ok, f"duration diff {duration_diff:.1%}, spectral similarity {similarity:.3f}"
+
+
+def _apply(model, model_dir: str, backend: str):
+    if backend == "int8":
+        return _apply_int8(model)
+    if backend == "compile":
+        return _apply_compile(model)
+    if backend == "onnx":
+        return _apply_onnx(model, model_dir)
+    return None
+
+
+def apply_backend(model, model_dir: str, backend: str) -> bool:
+    """
+    Apply a backend already validated by optimize_for_cpu to another copy of
+    the model (e.g. a TTS replica), skipping the probe and parity check.
+
+    Returns:
+        True if the backend is in effect on this model
+    """
+    if backend in (None, "eager", "cuda"):
+        return True
+    try:
+        return _apply(model, model_dir, backend) is not None
+    except Exception as e:
+        logger.error("Failed to apply %s TTS backend to replica: %s", backend, e)
+        return False
+
+
+def optimize_for_cpu(model, model_dir: str, synthesize) -> str:
+    """
+    Apply TTS_CPU_BACKEND to a freshly loaded CosyVoice model.
+
+    Args:
+        model: Loaded CosyVoice model
+        model_dir: Directory the model was loaded from (for exported ONNX files)
+        synthesize: Callable (model, text) -> (audio, sample_rate)
+
+    Returns:
+        Name of the backend in effect
+    """
+    if torch.cuda.is_available():
+        return "cuda"
+    if TTS_CPU_THREADS:
+        torch.set_num_threads(TTS_CPU_THREADS)
+
+    backend = TTS_CPU_BACKEND
+    if backend not in ("eager", "int8", "compile", "onnx"):
+        logger.warning("Unknown TTS_CPU_BACKEND '%s', using eager", backend)
+        backend = "eager"
+
+    # The first synthesis after load is a cold run (allocations, lazy init);
+    # warm up so eager is measured under the same conditions as the candidate
+    _measure(synthesize, model)
+    reference, eager_rtf = _measure(synthesize, model)
+    if reference is None:
+        logger.warning("TTS probe produced no audio, CPU backend left as eager")
+        return "eager"
+    logger.info("TTS CPU eager RTF: %.2f", eager_rtf)
+    if backend == "eager":
+        return backend
+
+    try:
+        restore = _apply(model, model_dir, backend)
+    except Exception as e:
+        logger.error("Failed to apply %s TTS backend: %s", backend, e)
+        return "eager"
+    if restore is None:
+        return "eager"
+
+    try:
+        if backend == "compile":
+            # First call triggers compilation, measure the second one
+            _measure(synthesize, model)
+        candidate, rtf = _measure(synthesize, model)
+        if TTS_CPU_PARITY_CHECK:
+            ok, details = _check_parity(reference, candidate)
+        else:
+            ok, details = candidate is not None, "parity check disabled"
+    except Exception as e:
+        ok, details, rtf = False, f"synthesis failed: {e}", None
+
+    if not ok:
+        restore()
+        logger.error("TTS %s backend failed parity check (%s), reverted to eager", backend, details)
+        return "eager"
+
+    logger.info("TTS CPU backend: %s (RTF %.2f -> %.2f, %s)", backend, eager_rtf, rtf, details)
+    return backend
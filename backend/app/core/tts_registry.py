@@ -0,0 +1,242 @@
+"""
+Registry of loaded CosyVoice models.
+
+Several voices can be served at once; voices that share a model directory
+share the loaded model. Loaded models stay resident under a memory budget
+(TTS_MEMORY_BUDGET_MB) with least-recently-used eviction, and models that have
+not been used for TTS_IDLE_UNLOAD_S are unloaded by a background task. Pinned
+models (the default voice) are never evicted.
+
+Weights are loaded memory-mapped (torch.load(mmap=True) + load_state_dict(
+assign=True)), so on CPU the parameters are backed by the page cache and
+worker processes loading the same checkpoint share physical pages.
+"""
+import os
+import gc
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+TTS_MEMORY_BUDGET_MB = float(os.getenv("TTS_MEMORY_BUDGET_MB", "0"))  # 0 = unlimited
+TTS_IDLE_UNLOAD_S = float(os.getenv("TTS_IDLE_UNLOAD_S", "600"))  # 0 = never unload
+TTS_MMAP_WEIGHTS = os.getenv("TTS_MMAP_WEIGHTS", "true").lower() == "true"
+
+_mmap_lock = threading.Lock()
+
+
+@contextmanager
+def mmap_weights():
+    """
+    Make torch.load memory-map checkpoints and load_state_dict adopt the loaded
+    tensors instead of copying them into freshly allocated parameters.
+
+    The patch is process-wide while active, so loads are serialized by a lock.
+    Checkpoints that cannot be memory-mapped (legacy format) load normally.
+    """
+    if not TTS_MMAP_WEIGHTS:
+        yield
+        return
+    with _mmap_lock:
+        original_load = torch.load
+        original_load_state_dict = torch.nn.Module.load_state_dict
+
+        def load(f, *args, **kwargs):
+            if isinstance(f, (str, os.PathLike)) and "mmap" not in kwargs:
+                try:
+                    return original_load(f, *args, mmap=True, **kwargs)
+                except RuntimeError:
+                    pass
+            return original_load(f, *args, **kwargs)
+
+        def load_state_dict(self, state_dict, strict=True, assign=False):
+            return original_load_state_dict(self, state_dict, strict=strict, assign=True)
+
+        torch.load = load
+        torch.nn.Module.load_state_dict = load_state_dict
+        try:
+            yield
+        finally:
+            torch.load = original_load
+            torch.nn.Module.load_state_dict = original_load_state_dict
+
+
+def checkpoint_bytes(model_dir: str) -> int:
+    """Size of the checkpoints in a model directory, used before the model is loaded"""
+    return sum(path.stat().st_size for path in Path(model_dir).glob("*.pt"))
+
+
+def model_bytes(model) -> int:
+    """Parameter and buffer memory of a loaded CosyVoice model"""
+    seen = set()
+    total = 0
+    for module in vars(getattr(model, "model", model)).values():
+        if not isinstance(module, torch.nn.Module):
+            continue
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            if tensor.data_ptr() in seen:
+                continue
+            seen.add(tensor.data_ptr())
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ModelEntry:
+    """One loaded model directory: its replicas plus usage bookkeeping"""
+
+    def __init__(self, model_dir: str, replicas: List, info: Optional[dict] = None):
+        self.model_dir = model_dir
+        self.replicas: asyncio.Queue = asyncio.Queue()
+        for replica in replicas:
+            self.replicas.put_nowait(replica)
+        self.replica_count = len(replicas)
+        self.info = info or {}
+        self.size_bytes = sum(model_bytes(replica) for replica in replicas)
+        self.pinned = False
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        self.loaded_at = time.monotonic()
+
+
+class ModelRegistry:
+    """
+    Loads model directories on demand and keeps them resident under the
+    memory budget.
+
+    Args:
+        load: Callable (model_dir) -> (replicas, info), run in a worker thread
+        estimate: Callable (model_dir) -> expected bytes, used for eviction
+            before loading
+    """
+
+    def __init__(self, load: Callable, estimate: Callable[[str], int]):
+        self._load = load
+        self._estimate = estimate
+        self._entries: "OrderedDict[str, ModelEntry]" = OrderedDict()
+        self._lock = asyncio.Lock()
+        self.budget_bytes = int(TTS_MEMORY_BUDGET_MB * 1024 * 1024)
+        self.loads = 0
+        self.evictions = 0
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(entry.size_bytes for entry in self._entries.values())
+
+    def _take(self, entry: ModelEntry) -> ModelEntry:
+        entry.in_use += 1
+        entry.last_used = time.monotonic()
+        self._entries.move_to_end(entry.model_dir)
+        return entry
+
+    async def acquire(self, model_dir: str, pinned: bool = False) -> ModelEntry:
+        """Get the entry for model_dir, loading it if needed. Pair with release()."""
+        entry = self._entries.get(model_dir)
+        if entry is not None:
+            return self._take(entry)
+        async with self._lock:
+            entry = self._entries.get(model_dir)
+            if entry is None:
+                self._make_room(self._estimate(model_dir))
+                start = time.perf_counter()
+                loop = asyncio.get_event_loop()
+                replicas, info = await loop.run_in_executor(None, self._load, model_dir)
+                entry = ModelEntry(model_dir, replicas, info)
+                self._entries[model_dir] = entry
+                self.loads += 1
+                logger.info("TTS model loaded", extra={
+                    "model_dir": model_dir,
+                    "replicas": entry.replica_count,
+                    "size_mb": round(entry.size_bytes / 1024 / 1024),
+                    "load_s": round(time.perf_counter() - start, 2),
+                })
+            entry.pinned = entry.pinned or pinned
+            return self._take(entry)
+
+    def release(self, entry: ModelEntry):
+        entry.in_use -= 1
+        entry.last_used = time.monotonic()
+
+    def _make_room(self, needed: int):
+        """Evict least recently used models until `needed` more bytes fit in the budget"""
+        if not self.budget_bytes:
+            return
+        for model_dir in list(self._entries):
+            if self.resident_bytes + needed <= self.budget_bytes:
+                return
+            entry = self._entries[model_dir]
+            if entry.pinned or entry.in_use:
+                continue
+            self._unload(entry, "evicted")
+        if self.resident_bytes + needed > self.budget_bytes:
+            logger.warning("TTS memory budget exceeded, loading anyway", extra={
+                "resident_mb": round(self.resident_bytes / 1024 / 1024),
+                "needed_mb": round(needed / 1024 / 1024),
+                "budget_mb": TTS_MEMORY_BUDGET_MB,
+            })
+
+    def _unload(self, entry: ModelEntry, reason: str):
+        del self._entries[entry.model_dir]
+        self.evictions += 1
+        logger.info("TTS model unloaded", extra={
+            "model_dir": entry.model_dir,
+            "reason": reason,
+            "size_mb": round(entry.size_bytes / 1024 / 1024),
+        })
+        entry.replicas = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def unload_idle(self, idle_s: float = TTS_IDLE_UNLOAD_S):
+        """Unload unpinned models that have not been used for idle_s seconds"""
+        if idle_s <= 0:
+            return
+        now = time.monotonic()
+        for entry in list(self._entries.values()):
+            if not entry.pinned and not entry.in_use and now - entry.last_used > idle_s:
+                self._unload(entry, "idle")
+
+    async def run_idle_unloader(self):
+        """Background task: periodically unload idle models (started from the app lifespan)"""
+        if TTS_IDLE_UNLOAD_S <= 0:
+            return
+        interval = min(60.0, TTS_IDLE_UNLOAD_S / 2)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.unload_idle()
+            except Exception as e:
+                logger.warning("Idle model unload failed: %s", e)
+
+    def get(self, model_dir: str) -> Optional[ModelEntry]:
+        """Loaded entry for model_dir without touching LRU order, or None"""
+        return self._entries.get(model_dir)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            "budget_mb": TTS_MEMORY_BUDGET_MB,
+            "resident_mb": round(self.resident_bytes / 1024 / 1024),
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "models": [
+                {
+                    "model_dir": entry.model_dir,
+                    "replicas": entry.replica_count,
+                    "size_mb": round(entry.size_bytes / 1024 / 1024),
+                    "pinned": entry.pinned,
+                    "in_use": entry.in_use,
+                    "idle_s": round(now - entry.last_used),
+                    **entry.info,
+                }
+                for entry in reversed(self._entries.values())
+            ],
+        }
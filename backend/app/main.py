@@ -3,11 +3,40 @@ import os
 # Fix for OMP: Error #15: Initializing libiomp5md.dll, but found libiomp5md.dll already initialized.
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
+from app.core.log import setup_logging
+
+# 在导入各模块（加载模型时即会输出日志）之前配置日志
+setup_logging()
+
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.websocket import router as websocket_router
+from app.api.tts_batch import router as tts_batch_router
+from app.api.transcribe import router as transcribe_router
+from app.api.admin import router as admin_router
+from app.api.status import router as status_router
+from app.core import tts, filler, llm
+
+# 启动时预加载 TTS 模型（同时完成 CPU 推理后端选择与 RTF 测量）
+TTS_PRELOAD = os.getenv("TTS_PRELOAD", "false").lower() == "true"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if TTS_PRELOAD:
+        await tts.preload()
+    # 后台预合成默认音色的填充语音
+    filler.prerender(tts.DEFAULT_VOICE)
+    # 后台卸载长时间未使用的 TTS 模型
+    unloader = asyncio.create_task(tts.registry.run_idle_unloader())
+    # LLM 端点健康检查
+    health_checks = asyncio.create_task(llm.run_health_checks())
+    yield
+    unloader.cancel()
+    health_checks.cancel()
 
-app = FastAPI(title="Auralis Backend")
+app = FastAPI(title="Auralis Backend", lifespan=lifespan)
 
 # 配置 CORS，允许前端跨域访问
 app.add_middleware(
@@ -20,6 +49,10 @@ app.add_middleware(
 
 # 注册路由
 app.include_router(websocket_router)
+app.include_router(tts_batch_router)
+app.include_router(transcribe_router)
+app.include_router(admin_router)
+app.include_router(status_router)
 
 @app.get("/")
 def read_root():
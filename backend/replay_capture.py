@@ -0,0 +1,218 @@
+"""
+Replay captured /ws/chat sessions against a running server.
+
+Captures are recorded by the server when CAPTURE_DIR is set (see
+app/core/capture.py). Each capture is played back with its original timing,
+optionally accelerated, and many copies can run concurrently. Per-turn latency
+is measured from the moment the client finishes a turn (audio-end / text-input):
+
+    asr         first user-message (speech recognized)
+    first_text  first text-update (LLM first token)
+    first_audio first audio-chunk (time to first audio)
+    complete    status idle (turn finished)
+
+Usage:
+    python replay_capture.py captures/ --speed 4 --concurrency 10 --output new.json
+    python replay_capture.py captures/ --compare baseline.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+import websockets
+
+sys.path.insert(0, str(Path(__file__).parent))
+from app.core.capture import KIND_BINARY, KIND_CLOSE, KIND_TEXT, read_capture
+
+STAGES = ("asr", "first_text", "first_audio", "complete")
+# 服务端消息 -> 对应的阶段
+STAGE_MESSAGES = {"user-message": "asr", "text-update": "first_text", "audio-chunk": "first_audio"}
+
+
+def collect_captures(paths):
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(path.glob("*.cap.gz")))
+        else:
+            files.append(path)
+    return files
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def replay_session(url, records, speed, turn_timeout, results):
+    """回放一个会话，把每个回合的各阶段延迟追加到 results"""
+    open_turns = []  # 已发送、尚未结束的回合：{"sent_at", stage: latency...}
+    all_done = asyncio.Event()
+    all_done.set()
+
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+
+            async def receive():
+                async for raw in ws:
+                    now = time.perf_counter()
+                    if isinstance(raw, bytes):
+                        message = {"type": "audio-chunk"}
+                    else:
+                        message = json.loads(raw)
+                    kind = message.get("type")
+                    if kind == "busy":
+                        results["rejected"] += 1
+                        return
+                    if not open_turns:
+                        continue
+                    turn = open_turns[0]
+                    stage = STAGE_MESSAGES.get(kind)
+                    if message.get("filler"):
+                        # 填充语音不是回复本身，不计入首段语音延迟
+                        stage = None
+                    if stage and stage not in turn:
+                        turn[stage] = now - turn["sent_at"]
+                    if kind == "status" and message.get("content") == "idle":
+                        turn["complete"] = now - turn["sent_at"]
+                        results["turns"].append(open_turns.pop(0))
+                        if not open_turns:
+                            all_done.set()
+
+            receiver = asyncio.create_task(receive())
+            start = time.perf_counter()
+            try:
+                for offset, kind, payload in records:
+                    if kind == KIND_CLOSE:
+                        break
+                    if speed > 0:
+                        delay = start + offset / speed - time.perf_counter()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    if receiver.done():
+                        break
+                    if kind == KIND_BINARY:
+                        await ws.send(payload)
+                        continue
+                    text = payload.decode("utf-8")
+                    await ws.send(text)
+                    if kind == KIND_TEXT:
+                        try:
+                            message_type = json.loads(text).get("type")
+                        except (json.JSONDecodeError, AttributeError):
+                            continue
+                        if message_type in ("audio-end", "text-input"):
+                            open_turns.append({"sent_at": time.perf_counter()})
+                            all_done.clear()
+                # 等待已发出的回合处理完再断开
+                try:
+                    await asyncio.wait_for(all_done.wait(), turn_timeout)
+                except asyncio.TimeoutError:
+                    results["timeouts"] += len(open_turns)
+            finally:
+                receiver.cancel()
+        results["sessions"] += 1
+    except Exception as e:
+        results["errors"] += 1
+        print(f"❌ Session failed: {e}")
+
+
+def summarize(results, elapsed):
+    summary = {
+        "sessions": results["sessions"],
+        "turns": len(results["turns"]),
+        "rejected": results["rejected"],
+        "timeouts": results["timeouts"],
+        "errors": results["errors"],
+        "elapsed_s": round(elapsed, 2),
+        "stages": {},
+    }
+    for stage in STAGES:
+        values = [turn[stage] * 1000 for turn in results["turns"] if stage in turn]
+        if not values:
+            continue
+        summary["stages"][stage] = {
+            "count": len(values),
+            "mean_ms": round(sum(values) / len(values), 1),
+            "p50_ms": round(percentile(values, 50), 1),
+            "p90_ms": round(percentile(values, 90), 1),
+            "p99_ms": round(percentile(values, 99), 1),
+        }
+    return summary
+
+
+def print_summary(summary, baseline=None):
+    print("=" * 72)
+    print(f"Sessions: {summary['sessions']}  Turns: {summary['turns']}  Rejected: {summary['rejected']}  "
+          f"Timeouts: {summary['timeouts']}  Errors: {summary['errors']}  Elapsed: {summary['elapsed_s']}s")
+    print("=" * 72)
+    header = f"{'stage':<12}{'metric':<8}{'current':>12}"
+    if baseline:
+        header += f"{'baseline':>12}{'diff':>12}"
+    print(header)
+    for stage in STAGES:
+        current = summary["stages"].get(stage)
+        if not current:
+            continue
+        before = (baseline or {}).get("stages", {}).get(stage, {})
+        for metric in ("p50_ms", "p90_ms", "p99_ms"):
+            line = f"{stage:<12}{metric[:-3]:<8}{current[metric]:>10.1f}ms"
+            if baseline and metric in before:
+                diff = current[metric] - before[metric]
+                pct = diff / before[metric] * 100 if before[metric] else 0.0
+                line += f"{before[metric]:>10.1f}ms{diff:>+9.1f}ms ({pct:+.1f}%)"
+            print(line)
+
+
+async def run(args):
+    files = collect_captures(args.captures)
+    if not files:
+        print("❌ No capture files found")
+        return 1
+    sessions = [list(read_capture(str(path))) for path in files]
+    print(f"Replaying {len(sessions)} capture(s) x{args.concurrency} at speed {args.speed or 'max'} -> {args.url}")
+
+    results = {"turns": [], "sessions": 0, "rejected": 0, "timeouts": 0, "errors": 0}
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        replay_session(args.url, records, args.speed, args.turn_timeout, results)
+        for records in sessions
+        for _ in range(args.concurrency)
+    ])
+    summary = summarize(results, time.perf_counter() - start)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_summary(summary, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured /ws/chat sessions and report per-stage latency")
+    parser.add_argument("captures", nargs="+", help="Capture files (*.cap.gz) or directories containing them")
+    parser.add_argument("--url", default=os.getenv("REPLAY_URL", "ws://localhost:8000/ws/chat"))
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Playback speed factor (2 = twice as fast, 0 = no delays)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent copies of each capture")
+    parser.add_argument("--turn-timeout", type=float, default=120.0,
+                        help="Seconds to wait for outstanding turns after the last message")
+    parser.add_argument("--output", help="Write the summary JSON here (use as a later --compare baseline)")
+    parser.add_argument("--compare", help="Baseline summary JSON to diff against")
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
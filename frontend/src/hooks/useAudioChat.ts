@@ -78,6 +78,22 @@ export const useAudioChat = ({ t }: UseAudioChatProps) => {
             setStatus(data.content as AppStatus);
         }
         break;
+
+      case 'error':
+        // 服务端错误提示，以系统消息形式展示
+        console.warn('Server error:', data.content);
+        setMessages((prev) => [...prev, { role: 'ai', text: `[${data.content}]` }]);
+        break;
+
+      case 'queued':
+        console.warn(`Server busy, queued (~${data.retry_after}s)`);
+        break;
+
+      case 'busy':
+        // 服务端满载拒绝连接，随后连接会被关闭
+        console.warn('Server busy:', data.content);
+        setMessages((prev) => [...prev, { role: 'ai', text: `[${data.content}, retry in ${data.retry_after}s]` }]);
+        break;
     }
   };
 
@@ -10,11 +10,23 @@ export type AppStatus = 'idle' | 'recording' | 'processing' | 'playing';
 export type ClientMessage = 
   | { type: 'audio-chunk'; content: string } // Base64 音频
   | { type: 'audio-end' }                     // 录音结束信号
-  | { type: 'text-input'; content: string }; // 文本输入
+  | { type: 'text-input'; content: string }  // 文本输入
+  | { type: 'config'; sample_rate?: number | null; input_format?: InputFormat; voice?: string; audio_transport?: AudioTransport }; // 会话参数协商（输出采样率、录音格式、音色、语音传输方式）
+
+// 录音输入格式：webm（MediaRecorder，默认）、pcm16（16kHz 单声道）、opus（16kHz 单声道裸包）
+// pcm16/opus 的录音切片可直接以二进制帧发送
+export type InputFormat = 'webm' | 'pcm16' | 'opus';
+
+// 下行语音传输方式：json（audio-chunk 消息内 base64，默认）或 binary（每段 WAV 作为一个二进制帧）
+export type AudioTransport = 'json' | 'binary';
 
 // WebSocket 接收的消息
 export type ServerMessage =
   | { type: 'text-update'; content: string } // AI 文本流式更新
   | { type: 'user-message'; content: string } // 用户消息（语音或文本输入）
-  | { type: 'audio-chunk'; content: string } // TTS 音频片段
-  | { type: 'status'; content: AppStatus };  // 状态变更
\ No newline at end of file
+  | { type: 'audio-chunk'; content: string; filler?: boolean } // TTS 音频片段（filler 为正式回复前的填充语音）
+  | { type: 'status'; content: AppStatus }   // 状态变更
+  | { type: 'error'; content: string }       // 服务端错误提示（如录音超限）
+  | { type: 'config'; content: { sample_rate: number | null; input_format: InputFormat; voice: string; audio_transport: AudioTransport } } // 生效的会话参数
+  | { type: 'queued'; retry_after: number }  // 服务端满载，连接排队中
+  | { type: 'busy'; content: string; retry_after: number }; // 服务端满载拒绝连接（随后以1013关闭）
\ No newline at end of file